@@ -0,0 +1,82 @@
+import asyncio
+import weakref
+import aiohttp
+from common.fastjson import dumps, loads
+from common.retry import with_backoff
+
+HTTP_TIMEOUT = 10
+
+# One long-lived session per event loop, so keep-alive connections survive
+# across decision cycles instead of being torn down after each build.
+_SHARED_SESSIONS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = (
+    weakref.WeakKeyDictionary()
+)
+
+def make_async_session() -> aiohttp.ClientSession:
+    """
+    Pooled aiohttp session; callers own its lifetime
+    (use as `async with make_async_session() as session:`).
+    """
+    return aiohttp.ClientSession(
+        headers={"User-Agent": "V2CryptoBot/1.0"},
+        connector=aiohttp.TCPConnector(limit=64, limit_per_host=32, ttl_dns_cache=300, keepalive_timeout=60),
+    )
+
+def shared_session() -> aiohttp.ClientSession:
+    """Returns the running loop's shared session, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    session = _SHARED_SESSIONS.get(loop)
+    if session is None or session.closed:
+        session = _SHARED_SESSIONS[loop] = make_async_session()
+    return session
+
+async def close_shared_session():
+    session = _SHARED_SESSIONS.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+async def fetch_json(session: aiohttp.ClientSession, url: str, timeout: float = HTTP_TIMEOUT, params=None):
+    async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=timeout)) as r:
+        r.raise_for_status()
+        return loads(await r.read())
+
+async def post_json(session: aiohttp.ClientSession, url: str, payload, headers: dict | None = None,
+                    timeout: float = HTTP_TIMEOUT, retries: int = 3):
+    """
+    POSTs payload as JSON and decodes the JSON reply. 429/5xx responses and
+    timeouts are retried by common.retry.with_backoff (jittered exponential
+    backoff honoring Retry-After). A str payload is taken as already-serialized JSON.
+    """
+    body = payload if isinstance(payload, str) else dumps(payload)
+    req_headers = {"Content-Type": "application/json", **(headers or {})}
+
+    async def attempt():
+        async with session.post(url, data=body, headers=req_headers,
+                                timeout=aiohttp.ClientTimeout(total=timeout)) as r:
+            r.raise_for_status()
+            return loads(await r.read())
+
+    return await with_backoff(attempt, max_retries=retries)
+
+async def post_sse(session: aiohttp.ClientSession, url: str, payload, headers: dict | None = None,
+                   timeout: float = HTTP_TIMEOUT):
+    """
+    POSTs payload as JSON and yields each decoded `data:` event of a
+    text/event-stream reply as it arrives, stopping at `data: [DONE]`.
+    A non-streaming (plain JSON) reply is yielded once as a whole.
+    """
+    req_headers = {"Content-Type": "application/json", "Accept": "text/event-stream", **(headers or {})}
+    async with session.post(url, data=dumps(payload), headers=req_headers,
+                            timeout=aiohttp.ClientTimeout(total=timeout)) as r:
+        r.raise_for_status()
+        if r.content_type != "text/event-stream":
+            yield loads(await r.read())
+            return
+        async for line in r.content:
+            if not line.startswith(b"data:"):
+                continue
+            data = line[5:].strip()
+            if data == b"[DONE]":
+                return
+            if data:
+                yield loads(data)
@@ -0,0 +1,25 @@
+"""
+JSON encode/decode for hot paths: orjson when installed, stdlib otherwise.
+dumps() always returns compact str; loads() accepts str or bytes.
+With orjson, numpy arrays and scalars serialize natively.
+"""
+try:
+    import orjson
+
+    def dumps(obj) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+    def dumps_pretty(obj, default=None) -> str:
+        return orjson.dumps(obj, default=default, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY).decode()
+
+    loads = orjson.loads
+except ImportError:  # pragma: no cover - exercised only without orjson
+    import json
+
+    def dumps(obj) -> str:
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+    def dumps_pretty(obj, default=None) -> str:
+        return json.dumps(obj, indent=2, default=default)
+
+    loads = json.loads
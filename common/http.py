@@ -1,20 +1,78 @@
+import random
+import threading
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
-def make_session():
-    s = requests.Session()
-    s.headers.update({"User-Agent": "V2CryptoBot/1.0"})
-    retry = Retry(
+POOL_SIZE = 64
+RETRY_BACKOFF_JITTER = 0.25  # seconds of random spread added to each backoff
+RETRY_BACKOFF_MAX = 10.0
+
+def _make_retry() -> Retry:
+    # Only connection errors, 429 and 5xx are retried; other 4xx fail on the first response.
+    kwargs = dict(
         total=5,
         backoff_factor=0.5,
         status_forcelist=(429, 500, 502, 503, 504),
         allowed_methods=frozenset(["GET", "POST", "DELETE"]),
         raise_on_status=False,
     )
-    s.mount("https://", HTTPAdapter(max_retries=retry))
-    s.mount("http://", HTTPAdapter(max_retries=retry))
+    try:
+        # urllib3 >= 2: jitter de-synchronizes retries across concurrent symbol fetches
+        return Retry(**kwargs, backoff_jitter=RETRY_BACKOFF_JITTER, backoff_max=RETRY_BACKOFF_MAX)
+    except TypeError:
+        return _JitteredRetry(**kwargs)
+
+class _JitteredRetry(Retry):
+    """urllib3 1.x fallback: same policy with jittered, capped backoff."""
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        if backoff <= 0:
+            return 0
+        return min(RETRY_BACKOFF_MAX, backoff + random.uniform(0, RETRY_BACKOFF_JITTER))
+
+def make_session():
+    s = requests.Session()
+    s.headers.update({
+        "User-Agent": "V2CryptoBot/1.0",
+        "Accept-Encoding": "gzip",
+        "Connection": "keep-alive",
+    })
+    retry = _make_retry()
+    # Default pool is 10 per host; concurrent symbol fetches would block on it.
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, pool_block=False)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
     return s
 
 # Use this everywhere for HTTP calls
-SESSION = make_session()
\ No newline at end of file
+SESSION = make_session()
+
+
+# url -> {"etag", "last_modified", "body"} from the last 200 response
+_COND_HEADERS: dict[str, dict] = {}
+_COND_LOCK = threading.Lock()
+
+def conditional_get(url: str, headers: dict | None = None, **kwargs) -> bytes:
+    """
+    GET via SESSION with If-None-Match / If-Modified-Since from the previous
+    response for `url`; returns the cached body on 304, the new body on 200.
+    Raises requests.HTTPError like raise_for_status() otherwise.
+    """
+    cached = _COND_HEADERS.get(url)
+    req_headers = dict(headers or {})
+    if cached:
+        if cached["etag"]:
+            req_headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            req_headers["If-Modified-Since"] = cached["last_modified"]
+    r = SESSION.get(url, headers=req_headers, **kwargs)
+    if r.status_code == 304 and cached:
+        return cached["body"]
+    r.raise_for_status()
+    etag = r.headers.get("ETag")
+    last_modified = r.headers.get("Last-Modified")
+    if etag or last_modified:
+        with _COND_LOCK:
+            _COND_HEADERS[url] = {"etag": etag, "last_modified": last_modified, "body": r.content}
+    return r.content
@@ -0,0 +1,102 @@
+import asyncio
+import contextlib
+import threading
+import time
+from collections import deque
+
+class SlidingWindowLimiter:
+    """
+    Blocks callers *before* a request would push usage over `limit` units
+    per `window` seconds (requests per minute by default; pass a weight,
+    e.g. estimated tokens, to enforce a TPM budget). Thread-safe; usable
+    from sync code (acquire_sync) and coroutines (acquire).
+    """
+
+    def __init__(self, limit: int, window: float = 60.0):
+        self.limit = limit
+        self.window = window
+        self._events: deque[tuple[float, int]] = deque()  # (monotonic ts, weight)
+        self._used = 0
+        self._lock = threading.Lock()
+
+    def _reserve(self, weight: int) -> float:
+        """Records the request and returns 0, or returns how long to wait first."""
+        with self._lock:
+            now = time.monotonic()
+            while self._events and self._events[0][0] <= now - self.window:
+                self._used -= self._events.popleft()[1]
+            # An empty window always admits, so an oversized request can't block forever
+            if self._events and self._used + weight > self.limit:
+                return self._events[0][0] + self.window - now
+            self._events.append((now, weight))
+            self._used += weight
+            return 0.0
+
+    def acquire_sync(self, weight: int = 1):
+        while True:
+            wait = self._reserve(weight)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def acquire(self, weight: int = 1):
+        while True:
+            wait = self._reserve(weight)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+class AIMDController:
+    """
+    Additive-increase / multiplicative-decrease concurrency limit for one
+    provider. Every `sample_size` requests the limit grows by `alpha` if
+    none failed and mean latency stayed within `target_latency` seconds,
+    otherwise it is multiplied by `beta`. Use as `async with ctl.slot(): ...`;
+    an exception inside the block (e.g. a 429/5xx raise_for_status) counts
+    as a failure.
+    """
+
+    def __init__(self, c_min: int = 1, c_max: int = 32, alpha: float = 0.5, beta: float = 0.5,
+                 target_latency: float = 1.0, sample_size: int = 10, initial: float = 4.0):
+        self.c_min = c_min
+        self.c_max = c_max
+        self.alpha = alpha
+        self.beta = beta
+        self.target_latency = target_latency
+        self.sample_size = sample_size
+        self.c = float(min(c_max, max(c_min, initial)))
+        self._in_flight = 0
+        self._samples: list[tuple[float, bool]] = []
+        self._cond = asyncio.Condition()
+
+    @property
+    def limit(self) -> int:
+        return max(1, int(self.c))
+
+    def record(self, latency: float, ok: bool):
+        self._samples.append((latency, ok))
+        if len(self._samples) < self.sample_size:
+            return
+        mean_latency = sum(lat for lat, _ in self._samples) / len(self._samples)
+        if all(ok for _, ok in self._samples) and mean_latency <= self.target_latency:
+            self.c = min(self.c_max, self.c + self.alpha)
+        else:
+            self.c = max(self.c_min, self.c * self.beta)
+        self._samples.clear()
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+        start = time.monotonic()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.record(time.monotonic() - start, ok)
+            async with self._cond:
+                self._in_flight -= 1
+                # The limit may have grown, so wake everyone rather than one waiter
+                self._cond.notify_all()
@@ -0,0 +1,81 @@
+"""
+Retry helpers with exponential backoff and jitter for HTTP calls.
+"""
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import aiohttp
+import requests
+from loguru import logger
+
+T = TypeVar('T')
+
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+def backoff_delay(attempt: int, base: float = 0.5, max_delay: float = 30.0,
+                  retry_after: Optional[str] = None) -> float:
+    """
+    Delay before retry number `attempt` (0-based).
+
+    Honors a numeric Retry-After header when present, otherwise uses
+    exponential backoff with up to one second of random jitter.
+    """
+    if retry_after:
+        try:
+            return min(float(retry_after), max_delay)
+        except ValueError:
+            pass
+    return min(base * 2 ** attempt + random.random(), max_delay)
+
+
+async def with_backoff(fn: Callable[[], Awaitable[T]], max_retries: int = 4,
+                       base: float = 0.5, max_delay: float = 30.0) -> T:
+    """
+    Await fn(), retrying on 429/5xx responses and timeouts.
+
+    fn must raise aiohttp.ClientResponseError for HTTP errors
+    (e.g. via response.raise_for_status()); other exceptions propagate.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return await fn()
+        except aiohttp.ClientResponseError as e:
+            if e.status not in RETRYABLE_STATUSES or attempt == max_retries:
+                raise
+            retry_after = e.headers.get('Retry-After') if e.headers else None
+            delay = backoff_delay(attempt, base, max_delay, retry_after)
+            logger.warning(f"HTTP {e.status} from {e.request_info.real_url}, retrying in {delay:.1f}s")
+        except asyncio.TimeoutError:
+            if attempt == max_retries:
+                raise
+            delay = backoff_delay(attempt, base, max_delay)
+            logger.warning(f"Request timed out, retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+
+def with_backoff_sync(fn: Callable[[], T], max_retries: int = 4,
+                      base: float = 0.5, max_delay: float = 30.0) -> T:
+    """
+    Blocking counterpart of with_backoff for requests-based calls.
+
+    Retries connection errors, timeouts and HTTPError with a 429/5xx status.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except requests.HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            if status not in RETRYABLE_STATUSES or attempt == max_retries:
+                raise
+            retry_after = e.response.headers.get('Retry-After')
+            delay = backoff_delay(attempt, base, max_delay, retry_after)
+            logger.warning(f"HTTP {status} from {e.response.url}, retrying in {delay:.1f}s")
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == max_retries:
+                raise
+            delay = backoff_delay(attempt, base, max_delay)
+            logger.warning(f"Request failed, retrying in {delay:.1f}s")
+        time.sleep(delay)
\ No newline at end of file
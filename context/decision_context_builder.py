@@ -1,28 +1,69 @@
-import json
+import asyncio
 from typing import Sequence, Dict, Any
-from data_feeds.multi_source_price_guard import verify_prices
-from data_feeds.sentiment_monitor import get_sentiment  # uses cache fallback
+from common.async_http import close_shared_session, shared_session
+from common.fastjson import dumps
+from data_feeds.multi_source_price_guard import verify_prices_async
+from data_feeds.sentiment_monitor import get_sentiment_async  # uses cache fallback
 
-def build_context(symbols: Sequence[str]) -> str:
+# Header row of the compact "toon" table format; llm.decision_engine describes it to the model.
+TOON_HEADER = "sym,price,binance,coinbase,sentiment"
+
+async def _build_entry(sym: str, session) -> Dict[str, Any]:
+    entry: Dict[str, Any] = {}
+    prices, score = await asyncio.gather(
+        verify_prices_async(sym, session),
+        get_sentiment_async(sym, session),
+        return_exceptions=True,
+    )
+    # Price verification
+    if isinstance(prices, BaseException):
+        entry.update({"price": None, "error": f"price_verification_failed: {prices}"})
+    else:
+        b, c, avg = prices
+        entry.update({"price": avg, "binance": b, "coinbase": c})
+    # Optional sentiment
+    if isinstance(score, BaseException):
+        entry["sentiment_error"] = str(score)
+    elif score is not None:
+        entry["sentiment"] = {"lunarcrush_galaxy_score": score}
+    return entry
+
+def _toon_num(v) -> str:
+    return "" if v is None else f"{v:.10g}"
+
+def _to_toon(context: Dict[str, Dict[str, Any]]) -> str:
+    """One header row, then one CSV row per symbol; unavailable values are empty cells."""
+    lines = [TOON_HEADER]
+    for sym, entry in context.items():
+        score = (entry.get("sentiment") or {}).get("lunarcrush_galaxy_score")
+        cells = [_toon_num(entry.get(k)) for k in ("price", "binance", "coinbase")]
+        lines.append(",".join([sym, *cells, _toon_num(score)]))
+    return "\n".join(lines)
+
+async def build_context(symbols: Sequence[str], session=None, fmt: str = "json") -> str:
     """
-    Builds a compact JSON context with verified prices (Binance vs Coinbase)
+    Builds a compact context with verified prices (Binance vs Coinbase)
     and optional sentiment (with cache fallback).
+    All symbols and sources are fetched concurrently over one pooled session
+    (the loop's shared session unless one is passed in).
+    fmt="json" (default) emits {symbol: {...}}; fmt="toon" emits a CSV-like
+    table (see TOON_HEADER) that costs noticeably fewer prompt tokens but
+    drops the per-symbol error strings.
     """
-    context: Dict[str, Dict[str, Any]] = {}
-    for sym in symbols:
-        entry: Dict[str, Any] = {}
-        # Price verification
-        try:
-            b, c, avg = verify_prices(sym)
-            entry.update({"price": avg, "binance": b, "coinbase": c})
-        except Exception as e:
-            entry.update({"price": None, "error": f"price_verification_failed: {e}"})
-        # Optional sentiment
+    if fmt not in ("json", "toon"):
+        raise ValueError(f"Unknown context format: {fmt}")
+    session = session or shared_session()
+    entries = await asyncio.gather(*(_build_entry(sym, session) for sym in symbols))
+    context: Dict[str, Dict[str, Any]] = {
+        sym.upper(): entry for sym, entry in zip(symbols, entries)
+    }
+    return _to_toon(context) if fmt == "toon" else dumps(context)
+
+def build_context_sync(symbols: Sequence[str], fmt: str = "json") -> str:
+    """Blocking wrapper around build_context for non-async callers."""
+    async def run() -> str:
         try:
-            score = get_sentiment(sym)
-            if score is not None:
-                entry["sentiment"] = {"lunarcrush_galaxy_score": score}
-        except Exception as e:
-            entry["sentiment_error"] = str(e)
-        context[sym.upper()] = entry
-    return json.dumps(context, separators=(",", ":"), ensure_ascii=False)
\ No newline at end of file
+            return await build_context(symbols, fmt=fmt)
+        finally:
+            await close_shared_session()
+    return asyncio.run(run())
@@ -1,31 +1,47 @@
+import io
 import os
-from common.http import SESSION as http
-from execution.coinbase_auth import sign_cb_request, now_ts_str
+from common.http import conditional_get
+from common.fastjson import dumps_pretty, loads
+from execution.coinbase_auth import get_credentials, sign_cb_request, now_ts_str
+
+try:
+    import ijson  # optional: incremental parse of large /accounts bodies
+except ImportError:
+    ijson = None
 
 HTTP_TIMEOUT = 10
 
+def _resolve_base_url() -> str | None:
+    # Only Exchange supported in this drop.
+    if os.getenv("COINBASE_API_TARGET", "exchange").lower() != "exchange":
+        return None
+    return "https://api.exchange.coinbase.com"
+
+# Resolved once; call refresh_config() after changing the environment
+_BASE_URL = _resolve_base_url()
+
+def refresh_config():
+    global _BASE_URL
+    _BASE_URL = _resolve_base_url()
+
 def _base_url() -> str:
-    target = os.getenv("COINBASE_API_TARGET", "exchange").lower()
-    if target != "exchange":
-        # Only Exchange supported in this drop.
+    if _BASE_URL is None:
         raise RuntimeError("Set COINBASE_API_TARGET=exchange (Advanced Trade not enabled in this build).")
-    return "https://api.exchange.coinbase.com"
+    return _BASE_URL
 
-def get_coinbase_portfolio():
+def get_coinbase_portfolio(fields=None):
     """
     Returns list of accounts (balances) from Coinbase Exchange.
     Requires API key/secret/passphrase with 'view' permission.
+    With fields (e.g. ("currency", "balance", "available")), only accounts
+    with a non-zero balance are returned, each reduced to those keys.
     """
-    api_key = os.getenv("COINBASE_API_KEY")
-    api_secret = os.getenv("COINBASE_API_SECRET")  # base64
-    api_passphrase = os.getenv("COINBASE_API_PASSPHRASE")
-    if not (api_key and api_secret and api_passphrase):
-        raise RuntimeError("Missing Coinbase API credentials in environment.")
+    api_key, api_secret, api_passphrase = get_credentials()
 
     method = "GET"
     request_path = "/accounts"
     ts = now_ts_str()
-    sig = sign_cb_request(api_secret, ts, method, request_path, None)
+    sig = sign_cb_request(api_secret, ts, method, request_path)
 
     headers = {
         "CB-ACCESS-KEY": api_key,
@@ -36,14 +52,26 @@ def get_coinbase_portfolio():
         "Accept": "application/json",
     }
 
-    r = http.get(f"{_base_url()}{request_path}", headers=headers, timeout=HTTP_TIMEOUT)
-    r.raise_for_status()
-    return r.json()
+    body = conditional_get(f"{_base_url()}{request_path}", headers=headers, timeout=HTTP_TIMEOUT)
+    if fields is None:
+        return loads(body)
+    return _project_accounts(body, fields)
+
+def _project_accounts(body: bytes, fields):
+    items = ijson.items(io.BytesIO(body), "item") if ijson is not None else loads(body)
+    out = []
+    for it in items:
+        try:
+            if float(it.get("balance", 0)) <= 0:
+                continue
+        except (TypeError, ValueError):
+            continue
+        out.append({k: it.get(k) for k in fields})
+    return out
 
 if __name__ == "__main__":
-    import json
     try:
         portfolio = get_coinbase_portfolio()
-        print(json.dumps(portfolio, indent=2))
+        print(dumps_pretty(portfolio))
     except Exception as e:
         print(f"Portfolio fetch failed: {e}")
\ No newline at end of file
@@ -1,67 +1,242 @@
+import asyncio
+import functools
 import os
 import time
 import math
-from typing import Tuple
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Sequence, Tuple
+import aiohttp
+import numpy as np
 from common.http import SESSION as http
+from common.async_http import close_shared_session, fetch_json, shared_session
+from common.fastjson import dumps, loads
+
+try:
+    # Drop-in float() replacement; noticeably faster on the string prices exchanges return
+    from fastnumbers import float as _to_float
+except ImportError:
+    _to_float = float
 
 HTTP_TIMEOUT = 8
+BINANCE_PING_URL = "https://api.binance.com/api/v3/ping"
+BINANCE_TICKER_URL = "https://api.binance.com/api/v3/ticker/price"
+COINBASE_TICKER_URL_FMT = "https://api.exchange.coinbase.com/products/{}/ticker"
+COINBASE_MAX_WORKERS = 16
 REL_TOL_DEFAULT = 0.005  # 0.5%
+PRICE_TTL_DEFAULT = 2.0  # seconds
+POLL_INTERVAL = 5.0  # seconds, __main__ polling cadence
+KEEPALIVE_INTERVAL = 30.0  # seconds between connection keep-warm pings
 
-def _rel_tol() -> float:
+def _env_float(name: str, default: float) -> float:
     try:
-        return float(os.getenv("PRICE_GUARD_TOLERANCE", REL_TOL_DEFAULT))
+        return float(os.getenv(name, default))
     except Exception:
-        return REL_TOL_DEFAULT
+        return default
+
+# Resolved once; call refresh_config() after changing the environment
+PRICE_TTL = _env_float("PRICE_CACHE_TTL", PRICE_TTL_DEFAULT)
+_TOL = _env_float("PRICE_GUARD_TOLERANCE", REL_TOL_DEFAULT)
+
+def refresh_config():
+    """Re-reads PRICE_CACHE_TTL and PRICE_GUARD_TOLERANCE from the environment."""
+    global PRICE_TTL, _TOL
+    PRICE_TTL = _env_float("PRICE_CACHE_TTL", PRICE_TTL_DEFAULT)
+    _TOL = _env_float("PRICE_GUARD_TOLERANCE", REL_TOL_DEFAULT)
+
+# symbol -> (monotonic ts, (binance, coinbase, avg)); only verified prices are stored
+_PRICE_CACHE: dict[str, tuple[float, tuple]] = {}
+_PRICE_CACHE_LOCK = threading.Lock()
+
+def _cached_prices(symbol: str):
+    hit = _PRICE_CACHE.get(symbol.upper())
+    if hit and time.monotonic() - hit[0] < PRICE_TTL:
+        return hit[1]
+    return None
 
+def _store_prices(symbol: str, prices: Tuple[float, float, float]) -> Tuple[float, float, float]:
+    with _PRICE_CACHE_LOCK:
+        _PRICE_CACHE[symbol.upper()] = (time.monotonic(), prices)
+    return prices
+
+@functools.lru_cache(maxsize=128)
 def _binance_symbol(symbol: str) -> str:
     return f"{symbol.upper()}USDT"
 
+@functools.lru_cache(maxsize=128)
 def _coinbase_product(symbol: str) -> str:
     return f"{symbol.upper()}-USD"
 
-def get_price_from_binance(symbol: str) -> float:
-    sym = _binance_symbol(symbol)
-    url = f"https://api.binance.com/api/v3/ticker/price?symbol={sym}"
-    r = http.get(url, timeout=HTTP_TIMEOUT)
-    r.raise_for_status()
-    data = r.json()
+def _coinbase_url(symbol: str) -> str:
+    return COINBASE_TICKER_URL_FMT.format(_coinbase_product(symbol))
+
+def _parse_price(exchange: str, data) -> float:
     price = data.get("price")
     if price is None:
-        raise ValueError(f"Binance bad payload: {data}")
-    return float(price)
+        raise ValueError(f"{exchange} bad payload: {data}")
+    return _to_float(price)
+
+def get_price_from_binance(symbol: str) -> float:
+    r = http.get(BINANCE_TICKER_URL, params={"symbol": _binance_symbol(symbol)}, timeout=HTTP_TIMEOUT)
+    r.raise_for_status()
+    return _parse_price("Binance", loads(r.content))
 
 def get_price_from_coinbase(symbol: str) -> float:
-    product = _coinbase_product(symbol)
-    url = f"https://api.exchange.coinbase.com/products/{product}/ticker"
-    r = http.get(url, timeout=HTTP_TIMEOUT)
+    r = http.get(_coinbase_url(symbol), timeout=HTTP_TIMEOUT)
     r.raise_for_status()
-    data = r.json()
-    price = data.get("price")
-    if price is None:
-        raise ValueError(f"Coinbase bad payload: {data}")
-    return float(price)
+    return _parse_price("Coinbase", loads(r.content))
+
+def get_prices_from_binance(symbols: Sequence[str]) -> Dict[str, float]:
+    """One request for all symbols via the ticker endpoint's `symbols=[...]` form."""
+    pairs = {_binance_symbol(s): s.upper() for s in symbols}
+    r = http.get(BINANCE_TICKER_URL, params={"symbols": dumps(list(pairs))}, timeout=HTTP_TIMEOUT)
+    r.raise_for_status()
+    return {pairs[row["symbol"]]: _parse_price("Binance", row) for row in loads(r.content) if row.get("symbol") in pairs}
+
+def get_prices_from_coinbase(symbols: Sequence[str]) -> Dict[str, float | Exception]:
+    """Coinbase has no bulk ticker; issue the per-product requests concurrently."""
+    def fetch(sym: str):
+        try:
+            return get_price_from_coinbase(sym)
+        except Exception as e:
+            return e
+    with ThreadPoolExecutor(max_workers=min(len(symbols), COINBASE_MAX_WORKERS) or 1) as pool:
+        return {s.upper(): p for s, p in zip(symbols, pool.map(fetch, symbols))}
+
+async def get_price_from_binance_async(symbol: str, session) -> float:
+    data = await fetch_json(session, BINANCE_TICKER_URL, HTTP_TIMEOUT, params={"symbol": _binance_symbol(symbol)})
+    return _parse_price("Binance", data)
+
+async def get_price_from_coinbase_async(symbol: str, session) -> float:
+    return _parse_price("Coinbase", await fetch_json(session, _coinbase_url(symbol), HTTP_TIMEOUT))
+
+def _check_divergence(symbol: str, p1: float, p2: float, tol: float | None = None) -> Tuple[float, float, float]:
+    total = p1 + p2
+    # Comparisons are False for NaN, so this also rejects NaN inputs
+    if not (p1 > 0 and p2 > 0 and total < math.inf):
+        raise ValueError(f"Invalid prices for {symbol}: Binance={p1}, Coinbase={p2}")
+    # |p1 - p2| / avg > tol, without the division
+    if abs(p1 - p2) * 2.0 > (_TOL if tol is None else tol) * total:
+        raise ValueError(f"Price mismatch for {symbol}: Binance={p1}, Coinbase={p2}")
+    return p1, p2, total * 0.5
 
 def verify_prices(symbol: str) -> Tuple[float, float, float]:
     """
     Returns (binance_price, coinbase_price, avg_price).
     Raises ValueError if divergence > tolerance or avg is invalid.
+    Verified results are memoized for PRICE_CACHE_TTL seconds.
     """
+    hit = _cached_prices(symbol)
+    if hit:
+        return hit
     p1 = get_price_from_binance(symbol)
     p2 = get_price_from_coinbase(symbol)
-    avg = (p1 + p2) / 2.0
-    if avg == 0 or math.isinf(avg) or math.isnan(avg):
-        raise ValueError(f"Invalid average price for {symbol}: {avg}")
-    if abs(p1 - p2) / avg > _rel_tol():
-        raise ValueError(f"Price mismatch for {symbol}: Binance={p1}, Coinbase={p2}")
-    return p1, p2, avg
+    return _store_prices(symbol, _check_divergence(symbol, p1, p2))
 
-if __name__ == "__main__":
-    symbols = ["BTC", "ETH"]
+def verify_prices_batch(symbols: Sequence[str]) -> Dict[str, Tuple[float, float, float] | Exception]:
+    """
+    Batched verify_prices: one Binance request plus concurrent Coinbase requests.
+    Maps each upper-cased symbol to (binance, coinbase, avg), or to the exception
+    that prevented verification.
+    """
+    results: Dict[str, Tuple[float, float, float] | Exception] = {}
+    pending = []
+    for sym in symbols:
+        hit = _cached_prices(sym)
+        if hit:
+            results[sym.upper()] = hit
+        else:
+            pending.append(sym.upper())
+    if not pending:
+        return results
+    try:
+        binance = get_prices_from_binance(pending)
+    except Exception as e:
+        binance = {sym: e for sym in pending}
+    coinbase = get_prices_from_coinbase(pending)
+    quoted = []
+    for sym in pending:
+        p1 = binance.get(sym, ValueError(f"Binance returned no price for {sym}"))
+        p2 = coinbase[sym]
+        if isinstance(p1, Exception):
+            results[sym] = p1
+        elif isinstance(p2, Exception):
+            results[sym] = p2
+        else:
+            quoted.append((sym, p1, p2))
+    if quoted:
+        results.update(_check_divergence_batch(quoted, _TOL))
+    return results
+
+def _check_divergence_batch(quoted, tol: float) -> Dict[str, Tuple[float, float, float] | Exception]:
+    """Vectorized _check_divergence over [(symbol, binance, coinbase), ...]."""
+    n = len(quoted)
+    b = np.fromiter((q[1] for q in quoted), dtype=np.float64, count=n)
+    c = np.fromiter((q[2] for q in quoted), dtype=np.float64, count=n)
+    total = b + c
+    with np.errstate(invalid="ignore"):
+        invalid = ~((b > 0) & (c > 0) & np.isfinite(total))
+        bad = np.abs(b - c) * 2.0 > tol * total
+    out: Dict[str, Tuple[float, float, float] | Exception] = {}
+    for i, (sym, p1, p2) in enumerate(quoted):
+        if invalid[i]:
+            out[sym] = ValueError(f"Invalid prices for {sym}: Binance={p1}, Coinbase={p2}")
+        elif bad[i]:
+            out[sym] = ValueError(f"Price mismatch for {sym}: Binance={p1}, Coinbase={p2}")
+        else:
+            out[sym] = _store_prices(sym, (p1, p2, float(total[i]) * 0.5))
+    return out
+
+async def verify_prices_async(symbol: str, session) -> Tuple[float, float, float]:
+    """
+    Same contract as verify_prices, but both exchanges are queried concurrently
+    over the caller's aiohttp session.
+    """
+    hit = _cached_prices(symbol)
+    if hit:
+        return hit
+    p1, p2 = await asyncio.gather(
+        get_price_from_binance_async(symbol, session),
+        get_price_from_coinbase_async(symbol, session),
+    )
+    return _store_prices(symbol, _check_divergence(symbol, p1, p2))
+
+async def _keepalive_task(session, interval: float = KEEPALIVE_INTERVAL):
+    """Pings Binance periodically so pooled connections are not dropped as idle."""
     while True:
-        for s in symbols:
-            try:
-                b, c, avg = verify_prices(s)
-                print(f"{s}: binance={b:.2f} coinbase={c:.2f} avg={avg:.2f}")
-            except Exception as e:
-                print(f"{s}: price verification failed: {e}")
-        time.sleep(5)
\ No newline at end of file
+        await asyncio.sleep(interval)
+        try:
+            async with session.head(BINANCE_PING_URL, timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT)):
+                pass
+        except Exception:
+            pass
+
+async def poll_prices(symbols: Sequence[str], interval: float = POLL_INTERVAL):
+    """
+    Prints verified prices every `interval` seconds on a fixed schedule
+    (work time is absorbed into the sleep, so the cadence doesn't drift;
+    a round that overruns just delays the next one instead of causing a burst).
+    """
+    session = shared_session()
+    keepalive = asyncio.create_task(_keepalive_task(session))
+    next_t = time.monotonic()
+    try:
+        while True:
+            results = await asyncio.gather(
+                *(verify_prices_async(s, session) for s in symbols), return_exceptions=True
+            )
+            for s, res in zip(symbols, results):
+                if isinstance(res, BaseException):
+                    print(f"{s}: price verification failed: {res}")
+                else:
+                    b, c, avg = res
+                    print(f"{s}: binance={b:.2f} coinbase={c:.2f} avg={avg:.2f}")
+            # After an overrun, restart the schedule from now rather than firing catch-up rounds
+            next_t = max(next_t + interval, time.monotonic())
+            await asyncio.sleep(max(0.0, next_t - time.monotonic()))
+    finally:
+        keepalive.cancel()
+        await close_shared_session()
+
+if __name__ == "__main__":
+    asyncio.run(poll_prices(["BTC", "ETH"]))
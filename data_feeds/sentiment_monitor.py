@@ -1,11 +1,24 @@
-import json
 import os
+import queue
+import threading
 import time
 from pathlib import Path
-from common.http import SESSION as http
+from common.http import conditional_get
+from common.async_http import fetch_json
+from common.fastjson import dumps_pretty, loads
 
 HTTP_TIMEOUT = 10
 CACHE_FILE = Path(__file__).resolve().parent.parent / "data" / "sentiment_cache.json"
+SENTIMENT_TTL_DEFAULT = 60.0  # seconds
+
+try:
+    SENTIMENT_TTL = float(os.getenv("SENTIMENT_CACHE_TTL", SENTIMENT_TTL_DEFAULT))
+except Exception:
+    SENTIMENT_TTL = SENTIMENT_TTL_DEFAULT
+
+# symbol -> (monotonic ts, score); in-process memo of live LunarCrush results
+_SENTIMENT_CACHE: dict[str, tuple[float, float]] = {}
+_SENTIMENT_CACHE_LOCK = threading.Lock()
 
 def fetch_lunarcrush_sentiment(symbol: str, api_key: str | None):
     """
@@ -14,10 +27,19 @@ def fetch_lunarcrush_sentiment(symbol: str, api_key: str | None):
     """
     if not api_key:
         return None
-    url = f"https://api.lunarcrush.com/v2?data=assets&symbol={symbol.upper()}&key={api_key}"
-    r = http.get(url, timeout=HTTP_TIMEOUT)
-    r.raise_for_status()
-    data = r.json()
+    body = conditional_get(_lunarcrush_url(symbol, api_key), timeout=HTTP_TIMEOUT)
+    return _parse_galaxy_score(loads(body))
+
+async def fetch_lunarcrush_sentiment_async(symbol: str, api_key: str | None, session):
+    """Async twin of fetch_lunarcrush_sentiment over the caller's aiohttp session."""
+    if not api_key:
+        return None
+    return _parse_galaxy_score(await fetch_json(session, _lunarcrush_url(symbol, api_key), HTTP_TIMEOUT))
+
+def _lunarcrush_url(symbol: str, api_key: str) -> str:
+    return f"https://api.lunarcrush.com/v2?data=assets&symbol={symbol.upper()}&key={api_key}"
+
+def _parse_galaxy_score(data):
     try:
         items = data.get("data") or data.get("results") or data.get("assets") or []
         if not items:
@@ -28,37 +50,120 @@ def fetch_lunarcrush_sentiment(symbol: str, api_key: str | None):
     except Exception:
         return None
 
-def _read_cache() -> dict:
+# Parsed contents of CACHE_FILE, loaded once and kept in sync with every write
+_CACHE: dict | None = None
+_CACHE_LOCK = threading.Lock()
+
+def _load_cache_file() -> dict:
     if CACHE_FILE.exists():
         try:
-            with open(CACHE_FILE, "r") as f:
-                return json.load(f)
+            return loads(CACHE_FILE.read_bytes())
         except Exception:
             return {}
     return {}
 
+def _read_cache() -> dict:
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = _load_cache_file()
+    return _CACHE
+
 def cache_sentiment(symbol: str, score):
-    CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    _write_cache([(symbol, score)])
+
+def _write_cache(items):
     cache = _read_cache()
-    cache[symbol.upper()] = {"score": score, "ts": int(time.time())}
-    with open(CACHE_FILE, "w") as f:
-        json.dump(cache, f, indent=2)
+    with _CACHE_LOCK:
+        ts = int(time.time())
+        for symbol, score in items:
+            cache[symbol.upper()] = {"score": score, "ts": ts}
+        CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        # Write-then-rename so readers never see a half-written file
+        tmp = CACHE_FILE.with_suffix(".tmp")
+        tmp.write_text(dumps_pretty(cache))
+        os.replace(tmp, CACHE_FILE)
+
+# (symbol, score) pairs waiting to be persisted by the background writer
+_WRITE_QUEUE: "queue.SimpleQueue[tuple[str, float]]" = queue.SimpleQueue()
+_WRITER: threading.Thread | None = None
+_WRITER_LOCK = threading.Lock()
+
+def _writer_loop():
+    while True:
+        items = [_WRITE_QUEUE.get()]
+        # Coalesce whatever queued up meanwhile into a single file write
+        while True:
+            try:
+                items.append(_WRITE_QUEUE.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            _write_cache(items)
+        except Exception:
+            pass
+
+def _enqueue_write(symbol: str, score: float):
+    global _WRITER
+    if _WRITER is None:
+        with _WRITER_LOCK:
+            if _WRITER is None:
+                _WRITER = threading.Thread(target=_writer_loop, name="sentiment-cache-writer", daemon=True)
+                _WRITER.start()
+    _WRITE_QUEUE.put((symbol, score))
+
+def _memo_get(symbol: str) -> float | None:
+    hit = _SENTIMENT_CACHE.get(symbol.upper())
+    if hit and time.monotonic() - hit[0] < SENTIMENT_TTL:
+        return hit[1]
+    return None
+
+def _memo_put(symbol: str, score: float):
+    with _SENTIMENT_CACHE_LOCK:
+        _SENTIMENT_CACHE[symbol.upper()] = (time.monotonic(), score)
+    _enqueue_write(symbol, score)
 
 def get_sentiment(symbol: str) -> float | None:
     """
     Returns sentiment score for symbol.
     Attempts live fetch if LUNARCRUSH_API_KEY is set; otherwise falls back to cache.
+    Live scores are memoized in-process for SENTIMENT_CACHE_TTL seconds.
     """
     api_key = os.getenv("LUNARCRUSH_API_KEY", "")
-    score = None
     if api_key:
+        hit = _memo_get(symbol)
+        if hit is not None:
+            return hit
         try:
             score = fetch_lunarcrush_sentiment(symbol, api_key)
             if score is not None:
-                cache_sentiment(symbol, score)
+                _memo_put(symbol, score)
+                return score
+        except Exception:
+            pass
+    return _cached_score(symbol)
+
+async def get_sentiment_async(symbol: str, session) -> float | None:
+    """
+    Async twin of get_sentiment: live LunarCrush fetch over the caller's
+    aiohttp session, falling back to the on-disk cache.
+    """
+    api_key = os.getenv("LUNARCRUSH_API_KEY", "")
+    if api_key:
+        hit = _memo_get(symbol)
+        if hit is not None:
+            return hit
+        try:
+            score = await fetch_lunarcrush_sentiment_async(symbol, api_key, session)
+            if score is not None:
+                _memo_put(symbol, score)
                 return score
         except Exception:
             pass
+    return _cached_score(symbol)
+
+def _cached_score(symbol: str) -> float | None:
     cache = _read_cache()
     entry = cache.get(symbol.upper())
     if entry:
@@ -4,17 +4,13 @@ Demo script for the LLM Logic Trading System with mock data.
 """
 import asyncio
 import json
-import sys
-from pathlib import Path
-
-# Add src directory to Python path
-sys.path.insert(0, str(Path(__file__).parent / 'src'))
 
 from src.data_sources import PriceFetcher, SentimentAnalyzer
 from src.portfolio import CoinbasePortfolioManager
 from src.risk import RiskManager
 from src.llm import LLMTradingAdvisor
-from src.utils import config
+from src.trading_system import TradingSystem
+from src.utils import LoggerConfig, config
 from loguru import logger
 
 
@@ -141,8 +137,6 @@ async def demo_integrated_system():
     print("="*60)
     
     # Create mock trading system with simulated data
-    from src.trading_system import TradingSystem
-    
     # Override price fetcher to return mock data
     class MockTradingSystem(TradingSystem):
         async def run_analysis_cycle(self, symbols=None):
@@ -235,4 +229,5 @@ async def main():
 
 
 if __name__ == "__main__":
+    LoggerConfig.setup_default_logging()
     asyncio.run(main())
\ No newline at end of file
@@ -1,21 +1,44 @@
 import base64
+import functools
 import hmac
-import json
+import os
 import time
 from hashlib import sha256
 
-def sign_cb_request(secret_b64: str, timestamp: str, method: str, request_path: str, body: dict | None):
+# (api_key, api_secret_b64, passphrase), read from the environment once
+_CREDS: tuple[str, str, str] | None = None
+
+def get_credentials() -> tuple[str, str, str]:
+    """
+    Returns (api_key, api_secret_b64, passphrase) from the environment,
+    cached after the first successful read.
+    """
+    global _CREDS
+    if _CREDS is None:
+        api_key = os.getenv("COINBASE_API_KEY")
+        api_secret = os.getenv("COINBASE_API_SECRET")  # base64
+        api_passphrase = os.getenv("COINBASE_API_PASSPHRASE")
+        if not (api_key and api_secret and api_passphrase):
+            raise RuntimeError("Missing Coinbase API credentials in environment.")
+        _CREDS = (api_key, api_secret, api_passphrase)
+    return _CREDS
+
+@functools.lru_cache(maxsize=1)
+def _hmac_template(secret_b64: str) -> "hmac.HMAC":
+    # Keyed once; .copy() per request skips the base64 decode and key schedule.
+    return hmac.new(base64.b64decode(secret_b64), digestmod=sha256)
+
+def sign_cb_request(secret_b64: str, timestamp: str, method: str, request_path: str, body_str: str = ""):
     """
     Coinbase Exchange HMAC SHA256 signature (base64 secret).
     method: "GET" | "POST" | "DELETE"
     request_path: e.g. "/orders" (leading slash, no host)
-    body: dict or None
+    body_str: the exact serialized request body that will be sent ("" for none)
     """
-    body_str = "" if body is None else json.dumps(body, separators=(",", ":"), ensure_ascii=False)
     prehash = f"{timestamp}{method.upper()}{request_path}{body_str}"
-    secret = base64.b64decode(secret_b64)
-    signature = hmac.new(secret, prehash.encode("utf-8"), sha256).digest()
-    return base64.b64encode(signature).decode("utf-8")
+    mac = _hmac_template(secret_b64).copy()
+    mac.update(prehash.encode("utf-8"))
+    return base64.b64encode(mac.digest()).decode("utf-8")
 
 def now_ts_str() -> str:
-    return str(int(time.time()))
\ No newline at end of file
+    return str(int(time.time()))
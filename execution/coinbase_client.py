@@ -1,16 +1,27 @@
-import json
 import os
 from common.http import SESSION as http
-from execution.coinbase_auth import sign_cb_request, now_ts_str
+from common.fastjson import dumps
+from execution.coinbase_auth import get_credentials, sign_cb_request, now_ts_str
 
 HTTP_TIMEOUT = 15
 
+def _resolve_base_url() -> str | None:
+    # Only Exchange supported in this drop.
+    if os.getenv("COINBASE_API_TARGET", "exchange").lower() != "exchange":
+        return None
+    return "https://api.exchange.coinbase.com"
+
+# Resolved once; call refresh_config() after changing the environment
+_BASE_URL = _resolve_base_url()
+
+def refresh_config():
+    global _BASE_URL
+    _BASE_URL = _resolve_base_url()
+
 def _base_url() -> str:
-    target = os.getenv("COINBASE_API_TARGET", "exchange").lower()
-    if target != "exchange":
-        # Only Exchange supported in this drop.
+    if _BASE_URL is None:
         raise RuntimeError("Set COINBASE_API_TARGET=exchange (Advanced Trade not enabled in this build).")
-    return "https://api.exchange.coinbase.com"
+    return _BASE_URL
 
 def place_order(product_id: str, side: str, size: float, price: float | None = None, order_type: str = "limit"):
     """
@@ -18,11 +29,7 @@ def place_order(product_id: str, side: str, size: float, price: float | None = N
     order_type: "limit" | "market"
     For "market", omit price.
     """
-    api_key = os.getenv("COINBASE_API_KEY")
-    api_secret = os.getenv("COINBASE_API_SECRET")
-    api_passphrase = os.getenv("COINBASE_API_PASSPHRASE")
-    if not (api_key and api_secret and api_passphrase):
-        raise RuntimeError("Missing Coinbase API credentials in environment.")
+    api_key, api_secret, api_passphrase = get_credentials()
 
     body = {
         "product_id": product_id,
@@ -39,9 +46,9 @@ def place_order(product_id: str, side: str, size: float, price: float | None = N
     path = "/orders"
 
     # Serialize EXACTLY ONCE and sign the same bytes we send
-    body_str = json.dumps(body, separators=(",", ":"), ensure_ascii=False)
+    body_str = dumps(body)
     ts = now_ts_str()
-    sig = sign_cb_request(api_secret, ts, method, path, body)
+    sig = sign_cb_request(api_secret, ts, method, path, body_str)
 
     headers = {
         "CB-ACCESS-KEY": api_key,
@@ -1,12 +1,14 @@
+import asyncio
+import hashlib
 import os
-import re
-import json
+import threading
+import time
+from collections import OrderedDict
 from typing import Any, Dict, List, Optional
 
-import requests
-from dotenv import load_dotenv
-
-load_dotenv()
+from common.async_http import close_shared_session, post_json, post_sse, shared_session
+from common.fastjson import dumps, loads
+from common.rate_limit import SlidingWindowLimiter
 
 DEFAULT_SYSTEM_PROMPT = (
     "You are a trading decision engine. Given compact JSON market context, "
@@ -15,39 +17,95 @@ DEFAULT_SYSTEM_PROMPT = (
     "Do not include any text outside the JSON."
 )
 
+# For contexts built with build_context(..., fmt="toon")
+TOON_SYSTEM_PROMPT = (
+    "You are a trading decision engine. Market context is a CSV table with header "
+    "sym,price,binance,coinbase,sentiment: price is the verified average of the Binance and "
+    "Coinbase quotes, sentiment is the LunarCrush galaxy score, and empty cells are unavailable. "
+    "Respond ONLY with a JSON array named decisions. Each item must be an object with: "
+    "symbol (string), action (BUY|SELL|HOLD), confidence (0..1), reason (short string). "
+    "Do not include any text outside the JSON."
+)
+
+# Read at import; entry points (main.py) load .env before importing this module
 LLM_ENDPOINT_URL = os.getenv("LLM_ENDPOINT_URL", "").strip()
 LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
 LLM_API_KEY = os.getenv("LLM_API_KEY", "").strip()
 HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", "30"))
+# Request an SSE stream and assemble the reply from deltas as they arrive
+LLM_STREAM = os.getenv("LLM_STREAM", "false").strip().lower() in ("1", "true", "yes")
 
-def _extract_json_block(text: str) -> Optional[str]:
-    """Best-effort extraction of the first top-level JSON object or array from text."""
-    # Try fenced code block first
-    fence = re.search(r"```(?:json)?\n(.*?)```", text, re.DOTALL | re.IGNORECASE)
-    if fence:
-        candidate = fence.group(1).strip()
-        try:
-            json.loads(candidate)
-            return candidate
-        except Exception:
-            pass
+# Provider budgets, enforced before sending so bursts don't turn into 429s
+_RPM_LIMITER = SlidingWindowLimiter(int(os.getenv("LLM_RPM_LIMIT", "500")))
+_TPM_LIMITER = SlidingWindowLimiter(int(os.getenv("LLM_TPM_LIMIT", "200000")))
+
+# Raw LLM replies keyed by a hash of (model, system prompt, context); 0 disables
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "300"))
+LLM_CACHE_SIZE = 256
+_RESPONSE_CACHE: "OrderedDict[bytes, tuple[float, str]]" = OrderedDict()
+_RESPONSE_CACHE_LOCK = threading.Lock()
+
+def _cache_key(system: str, context_json: str, model: Optional[str] = None) -> bytes:
+    h = hashlib.blake2b(digest_size=16)
+    for part in (model or LLM_MODEL, system, context_json):
+        h.update(part.encode())
+        h.update(b"\0")
+    return h.digest()
+
+def _cache_get(key: bytes) -> Optional[str]:
+    with _RESPONSE_CACHE_LOCK:
+        hit = _RESPONSE_CACHE.get(key)
+        if hit is None:
+            return None
+        if time.monotonic() >= hit[0]:
+            del _RESPONSE_CACHE[key]
+            return None
+        _RESPONSE_CACHE.move_to_end(key)
+        return hit[1]
 
-    # Fallback: find first {...} or [...] balanced block
-    stack = []
-    start = None
+def _cache_put(key: bytes, content: str):
+    if LLM_CACHE_TTL <= 0:
+        return
+    with _RESPONSE_CACHE_LOCK:
+        _RESPONSE_CACHE[key] = (time.monotonic() + LLM_CACHE_TTL, content)
+        _RESPONSE_CACHE.move_to_end(key)
+        while len(_RESPONSE_CACHE) > LLM_CACHE_SIZE:
+            _RESPONSE_CACHE.popitem(last=False)
+
+def _extract_json_block(text: str) -> Optional[str]:
+    """
+    Best-effort extraction of the first top-level JSON object or array from text.
+    Single forward scan tracking bracket depth and string/escape state, so
+    brackets inside JSON strings don't count; each balanced span is parsed once.
+    """
+    stack: List[str] = []
+    start = 0
+    in_string = False
+    escape = False
     for i, ch in enumerate(text):
-        if ch in "[{":
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch in "[{":
             if not stack:
                 start = i
-            stack.append(ch)
+            stack.append("]" if ch == "[" else "}")
+        elif not stack:
+            continue  # prose outside any block
+        elif ch == '"':
+            in_string = True
         elif ch in "]}":
-            if not stack:
+            if ch != stack.pop():
+                stack.clear()  # mismatched bracket: not JSON, keep scanning
                 continue
-            opening = stack.pop()
-            if not stack and start is not None:
+            if not stack:
                 candidate = text[start : i + 1]
                 try:
-                    json.loads(candidate)
+                    loads(candidate)
                     return candidate
                 except Exception:
                     pass
@@ -64,85 +122,79 @@ essential_schema_hint = {
     ]
 }
 
-def decide(context_json: str, system_prompt: Optional[str] = None) -> Dict[str, Any]:
-    """
-    Call the LLM (if configured) to produce structured trade decisions.
-
-    Returns a dict: {
-      "decisions": List[Dict[str, Any]],
-      "raw": Optional[str],
-      "used_endpoint": bool,
-      "error": Optional[str]
-    }
-    """
-    system = system_prompt or DEFAULT_SYSTEM_PROMPT
-
-    # If no endpoint configured, return a safe HOLD decision for discoverability.
-    if not LLM_ENDPOINT_URL:
-        try:
-            ctx = json.loads(context_json)
-            symbols = list(ctx.keys())
-        except Exception:
-            symbols = []
-        return {
-            "decisions": [
-                {
-                    "symbol": s,
-                    "action": "HOLD",
-                    "confidence": 0.0,
-                    "reason": "LLM endpoint not configured (LLM_ENDPOINT_URL)"
-                }
-                for s in symbols
-            ],
-            "raw": None,
-            "used_endpoint": False,
-            "error": None,
-        }
+# Constant tail of every user message, serialized once
+_SCHEMA_HINT_SUFFIX = (
+    "\n\nReturn only valid JSON matching this Python dict schema hint: " + dumps(essential_schema_hint)
+)
+_VALID_ACTIONS = {"BUY": "BUY", "SELL": "SELL", "HOLD": "HOLD"}
+_USER_PREFIX_JSON = "Market context (JSON):\n"
+_USER_PREFIX_TABLE = "Market context (table):\n"
+# Message dicts for the built-in prompts, shared by every request
+_SYSTEM_MESSAGES = {
+    prompt: {"role": "system", "content": prompt}
+    for prompt in (DEFAULT_SYSTEM_PROMPT, TOON_SYSTEM_PROMPT)
+}
+_AUTH_HEADERS = {"Authorization": f"Bearer {LLM_API_KEY}"} if LLM_API_KEY else {}
 
-    headers = {"Content-Type": "application/json"}
-    if LLM_API_KEY:
-        headers["Authorization"] = f"Bearer {LLM_API_KEY}"
+async def _query_endpoint(system: str, user_content: str, session) -> str:
+    """POSTs one chat completion and returns the reply content."""
+    headers = _AUTH_HEADERS
+    system_message = _SYSTEM_MESSAGES.get(system) or {"role": "system", "content": system}
 
     payload = {
         "model": LLM_MODEL,
-        "messages": [
-            {"role": "system", "content": system},
-            {
-                "role": "user",
-                "content": (
-                    "Market context (JSON):\n" + context_json +
-                    "\n\nReturn only valid JSON matching this Python dict schema hint: "
-                    + json.dumps(essential_schema_hint, separators=(",", ":"))
-                ),
-            },
-        ],
+        "messages": [system_message, {"role": "user", "content": user_content}],
         "temperature": 0.2,
         # If your endpoint honors response_format, you can uncomment:
         # "response_format": {"type": "json_object"},
     }
 
+    await _RPM_LIMITER.acquire()
+    # ~4 characters per token is close enough for budgeting
+    await _TPM_LIMITER.acquire((len(system) + len(user_content)) // 4)
+
+    url = LLM_ENDPOINT_URL.rstrip("/") + "/v1/chat/completions"
+    if LLM_STREAM:
+        return await _stream_content(session, url, {**payload, "stream": True}, headers)
+    data = await post_json(session, url, payload, headers=headers, timeout=HTTP_TIMEOUT)
+    return data.get("choices", [{}])[0].get("message", {}).get("content", "")
+
+async def _stream_content(session, url: str, payload: Dict[str, Any], headers: Dict[str, str]) -> str:
+    parts: List[str] = []
+    async for event in post_sse(session, url, payload, headers=headers, timeout=HTTP_TIMEOUT):
+        choice = (event.get("choices") or [{}])[0]
+        # "delta" for SSE chunks; "message" when the endpoint ignored stream=true
+        piece = (choice.get("delta") or choice.get("message") or {}).get("content")
+        if piece:
+            parts.append(piece)
+    return "".join(parts)
+
+def _build_prompt(context_json: str, system_prompt: Optional[str]) -> tuple[str, str, bool]:
+    """Returns (system, user_content, is_table) for a context from build_context."""
+    # Anything that is not a JSON object is the "toon" table from build_context(fmt="toon").
+    is_table = not context_json.lstrip().startswith("{")
+    system = system_prompt or (TOON_SYSTEM_PROMPT if is_table else DEFAULT_SYSTEM_PROMPT)
+    user_content = (_USER_PREFIX_TABLE if is_table else _USER_PREFIX_JSON) + context_json + _SCHEMA_HINT_SUFFIX
+    return system, user_content, is_table
+
+def _context_symbols(context_json: str, is_table: bool) -> List[str]:
+    if is_table:
+        return [row.split(",", 1)[0] for row in context_json.strip().splitlines()[1:] if row]
     try:
-        resp = requests.post(LLM_ENDPOINT_URL.rstrip("/") + "/v1/chat/completions",
-                             headers=headers, json=payload, timeout=HTTP_TIMEOUT)
-        resp.raise_for_status()
-        data = resp.json()
-        content = data.get("choices", [{}])[0].get("message", {}).get("content", "")
-    except Exception as e:
-        return {
-            "decisions": [],
-            "raw": None,
-            "used_endpoint": True,
-            "error": f"llm_request_failed: {e}",
-        }
+        return list(loads(context_json).keys())
+    except Exception:
+        return []
 
+def _parse_decisions(content: str) -> List[Dict[str, Any]]:
+    """Normalizes the LLM reply into decision dicts; malformed items are dropped."""
     # Try to parse strict JSON; otherwise extract best-effort
     parsed: Optional[Dict[str, Any]] = None
     try:
-        parsed = json.loads(content)
+        parsed = loads(content)
     except Exception:
         block = _extract_json_block(content) or content
         try:
-            parsed = json.loads(block)
+            parsed = loads(block)
         except Exception:
             parsed = None
 
@@ -151,26 +203,212 @@ def decide(context_json: str, system_prompt: Optional[str] = None) -> Dict[str,
         for item in parsed["decisions"]:
             if not isinstance(item, dict):
                 continue
-            symbol = str(item.get("symbol", "")).upper()
-            action = str(item.get("action", "HOLD")).upper()
-            if action not in {"BUY", "SELL", "HOLD"}:
-                action = "HOLD"
+            symbol = item.get("symbol")
+            if not symbol:
+                continue
+            action = _VALID_ACTIONS.get(str(item.get("action", "HOLD")).upper(), "HOLD")
             try:
                 confidence = float(item.get("confidence", 0.0))
             except Exception:
                 confidence = 0.0
-            reason = str(item.get("reason", ""))
-            if symbol:
-                decisions.append({
-                    "symbol": symbol,
-                    "action": action,
-                    "confidence": max(0.0, min(1.0, confidence)),
-                    "reason": reason,
-                })
+            decisions.append({
+                "symbol": str(symbol).upper(),
+                "action": action,
+                # Clamp to [0, 1]; NaN becomes 0
+                "confidence": confidence if 0.0 <= confidence <= 1.0 else (1.0 if confidence > 1.0 else 0.0),
+                "reason": str(item.get("reason", "")),
+            })
+    return decisions
+
+async def query_llm(context_json: str, system_prompt: Optional[str] = None, session=None) -> Dict[str, Any]:
+    """
+    Call the LLM (if configured) to produce structured trade decisions.
+    Uses the caller's aiohttp session, or the running loop's shared one.
+
+    Returns a dict: {
+      "decisions": List[Dict[str, Any]],
+      "raw": Optional[str],
+      "used_endpoint": bool,
+      "error": Optional[str]
+    }
+    """
+    system, user_content, is_table = _build_prompt(context_json, system_prompt)
+
+    # If no endpoint configured, return a safe HOLD decision for discoverability.
+    if not LLM_ENDPOINT_URL:
+        return {
+            "decisions": [
+                {
+                    "symbol": s,
+                    "action": "HOLD",
+                    "confidence": 0.0,
+                    "reason": "LLM endpoint not configured (LLM_ENDPOINT_URL)"
+                }
+                for s in _context_symbols(context_json, is_table)
+            ],
+            "raw": None,
+            "used_endpoint": False,
+            "error": None,
+        }
+
+    # Identical context within LLM_CACHE_TTL reuses the previous reply
+    key = _cache_key(system, context_json)
+    content = _cache_get(key)
+    if content is None:
+        try:
+            content = await _query_endpoint(system, user_content, session or shared_session())
+        except Exception as e:
+            return {
+                "decisions": [],
+                "raw": None,
+                "used_endpoint": True,
+                "error": f"llm_request_failed: {e}",
+            }
+        _cache_put(key, content)
 
     return {
-        "decisions": decisions,
+        "decisions": _parse_decisions(content),
         "raw": content,
         "used_endpoint": True,
         "error": None,
-    }
\ No newline at end of file
+    }
+
+def make_decider(endpoint: Optional[str] = None, api_key: Optional[str] = None, model: Optional[str] = None,
+                 system_prompt: Optional[str] = None, fmt: str = "json", session=None):
+    """
+    Returns `async def decide(context_json) -> dict` (same result as query_llm)
+    specialized for one endpoint, model, prompt and context format. The URL,
+    headers and request body around the context are built once here, so each
+    call only serializes the user message. Raises ValueError without an endpoint.
+    """
+    endpoint = endpoint or LLM_ENDPOINT_URL
+    if not endpoint:
+        raise ValueError("LLM endpoint not configured (LLM_ENDPOINT_URL)")
+    api_key = LLM_API_KEY if api_key is None else api_key
+    model = model or LLM_MODEL
+    is_table = fmt == "toon"
+    system = system_prompt or (TOON_SYSTEM_PROMPT if is_table else DEFAULT_SYSTEM_PROMPT)
+    user_prefix = _USER_PREFIX_TABLE if is_table else _USER_PREFIX_JSON
+    url = endpoint.rstrip("/") + "/v1/chat/completions"
+    headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+    body_head = (
+        '{"model":' + dumps(model) + ',"temperature":0.2,"messages":['
+        '{"role":"system","content":' + dumps(system) + '},{"role":"user","content":'
+    )
+    body_tail = "}]}"
+    system_tokens = len(system) // 4
+
+    async def _decide(context_json: str) -> Dict[str, Any]:
+        key = _cache_key(system, context_json, model)
+        content = _cache_get(key)
+        if content is None:
+            user_content = user_prefix + context_json + _SCHEMA_HINT_SUFFIX
+            await _RPM_LIMITER.acquire()
+            await _TPM_LIMITER.acquire(system_tokens + len(user_content) // 4)
+            try:
+                data = await post_json(session or shared_session(), url, body_head + dumps(user_content) + body_tail,
+                                       headers=headers, timeout=HTTP_TIMEOUT)
+            except Exception as e:
+                return {"decisions": [], "raw": None, "used_endpoint": True, "error": f"llm_request_failed: {e}"}
+            content = data.get("choices", [{}])[0].get("message", {}).get("content", "")
+            _cache_put(key, content)
+        return {"decisions": _parse_decisions(content), "raw": content, "used_endpoint": True, "error": None}
+
+    return _decide
+
+def decide(context_json: str, system_prompt: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Blocking wrapper around query_llm for non-async callers.
+    Async code should `await query_llm(...)` directly: this runs its own
+    event loop and so cannot be called from inside a running one.
+    """
+    async def run() -> Dict[str, Any]:
+        try:
+            return await query_llm(context_json, system_prompt)
+        finally:
+            await close_shared_session()
+    return asyncio.run(run())
+
+def _merge_contexts(contexts: List[str], is_table: bool) -> str:
+    """Combines several build_context outputs (all JSON or all table) into one."""
+    if is_table:
+        lines = contexts[0].strip().splitlines()[:1]
+        for ctx in contexts:
+            lines.extend(row for row in ctx.strip().splitlines()[1:] if row)
+        return "\n".join(lines)
+    merged: Dict[str, Any] = {}
+    for ctx in contexts:
+        merged.update(loads(ctx))
+    return dumps(merged)
+
+class BatchingLLMClient:
+    """
+    Coalesces query_llm calls submitted within `batch_interval_ms` of each other
+    (up to `max_batch_size`) into one LLM request over the merged context, then
+    hands each caller the decisions for its own symbols.
+    """
+
+    def __init__(self, batch_interval_ms: int = 20, max_batch_size: int = 8, session=None):
+        self.interval = batch_interval_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.session = session
+        self._queue: List[tuple] = []  # (context_json, system_prompt, future)
+        self._queued_symbols: set = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        # The loop only holds weak references to tasks, so keep in-flight flushes alive here
+        self._tasks: set = set()
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _take_batch(self) -> List[tuple]:
+        batch, self._queue = self._queue, []
+        self._queued_symbols = set()
+        return batch
+
+    async def submit(self, context_json: str, system_prompt: Optional[str] = None) -> Dict[str, Any]:
+        """Same contract as query_llm."""
+        is_table = not context_json.lstrip().startswith("{")
+        symbols = {s.upper() for s in _context_symbols(context_json, is_table)}
+        # Merging would overwrite a repeated symbol's context, so send what's queued first
+        if symbols & self._queued_symbols:
+            self._spawn(self._flush(self._take_batch()))
+        fut = asyncio.get_running_loop().create_future()
+        self._queue.append((context_json, system_prompt, fut))
+        self._queued_symbols |= symbols
+        if len(self._queue) >= self.max_batch_size:
+            self._spawn(self._flush(self._take_batch()))
+        elif self._flush_task is None:
+            self._flush_task = self._spawn(self._flush_later())
+        return await fut
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.interval)
+        self._flush_task = None
+        batch = self._take_batch()
+        if batch:
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        # Only contexts sharing a system prompt and encoding can go in one request
+        groups: Dict[tuple, list] = {}
+        for context_json, system_prompt, fut in batch:
+            is_table = not context_json.lstrip().startswith("{")
+            groups.setdefault((system_prompt, is_table), []).append((context_json, fut))
+        for (system_prompt, is_table), items in groups.items():
+            try:
+                merged = _merge_contexts([ctx for ctx, _ in items], is_table)
+                result = await query_llm(merged, system_prompt, self.session)
+            except Exception as e:
+                for _, fut in items:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            for ctx, fut in items:
+                if fut.done():
+                    continue
+                symbols = {s.upper() for s in _context_symbols(ctx, is_table)}
+                fut.set_result({**result, "decisions": [d for d in result["decisions"] if d["symbol"] in symbols]})
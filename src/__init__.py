@@ -1,10 +1,15 @@
 """
 Source package initialization.
+
+Subpackages load on first attribute access, so importing one module (e.g.
+src.trading_system) doesn't pull in every component's dependencies.
 """
-from . import data_sources
-from . import portfolio
-from . import risk
-from . import llm
-from . import utils
+import importlib
+
+__all__ = ['data_sources', 'portfolio', 'risk', 'llm', 'utils']
+
 
-__all__ = ['data_sources', 'portfolio', 'risk', 'llm', 'utils']
\ No newline at end of file
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f'.{name}', __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -3,61 +3,188 @@ Price fetcher module for multiple cryptocurrency data sources.
 """
 import asyncio
 import aiohttp
+import numpy as np
 import requests
 import time
-from typing import Dict, List, Optional, Union
+import types
+from typing import Dict, List, Optional, Tuple, Union
 from loguru import logger
-import json
+
+from common.fastjson import dumps_pretty, loads
+from common.rate_limit import AIMDController, SlidingWindowLimiter
+from common.retry import RETRYABLE_STATUSES, with_backoff
+
+# Symbol -> CoinGecko coin id
+_COIN_MAP = types.MappingProxyType({
+    'BTC': 'bitcoin',
+    'ETH': 'ethereum',
+    'ADA': 'cardano',
+    'SOL': 'solana',
+    'MATIC': 'polygon'
+})
+_PRICE_CACHE_DURATION = 300  # 5 minutes cache
+# Below this many symbols the NumPy setup costs more than the plain loop
+_NUMPY_MIN_SYMBOLS = 8
 
 
 class PriceFetcher:
     """Fetches cryptocurrency prices from multiple sources and verifies data."""
     
-    def __init__(self):
+    def __init__(self, max_concurrency: int = 10):
         self.sources = {
             'coingecko': self._fetch_coingecko,
             'coinbase': self._fetch_coinbase
         }
-        self.last_fetch_time = {}
-        self.cache_duration = 300  # 5 minutes cache
-        self.price_cache = {}
+        # Sources that can price many symbols in one request; get_prices uses
+        # these instead of the per-symbol entry in self.sources
+        self.batch_sources = {
+            'coingecko': self._fetch_coingecko_batch
+        }
+        self.cache_duration = _PRICE_CACHE_DURATION
+        # symbol -> (monotonic deadline, {source: price})
+        self._cache: Dict[str, Tuple[float, Dict[str, float]]] = {}
+        # Caps in-flight requests across all sources to respect provider rate limits
+        # (the semaphore itself is created per event loop by _bind_loop)
+        self.max_concurrency = max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # Per-provider request budgets (requests/minute), enforced before each call
+        self._limiters = {
+            'coingecko': SlidingWindowLimiter(30),
+            'coinbase': SlidingWindowLimiter(600)
+        }
+        # Per-provider concurrency that adapts to observed latency and 429/5xx
+        # responses; also created per event loop by _bind_loop
+        self._controllers: Dict[str, AIMDController] = {}
+        # Created on first use and reused so connections stay alive between fetches
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    def _bind_loop(self):
+        """
+        Create the semaphore, AIMD controllers and session afresh when first
+        used on a new event loop; asyncio primitives and aiohttp sessions only
+        work on the loop they were first used on.
+        """
+        loop = asyncio.get_running_loop()
+        if loop is self._loop:
+            return
+        self._loop = loop
+        self._session = None  # belonged to the previous loop
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._controllers = {
+            'coingecko': AIMDController(c_max=4),
+            'coinbase': AIMDController(c_max=self.max_concurrency)
+        }
+    
+    async def _ensure_session(self) -> aiohttp.ClientSession:
+        """Return the shared HTTP session, creating it on first use."""
+        self._bind_loop()
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=64, ttl_dns_cache=300, enable_cleanup_closed=True),
+                timeout=aiohttp.ClientTimeout(total=10)
+            )
+        return self._session
+    
+    async def _get_json(self, source: str, url: str, params: Optional[Dict[str, str]] = None):
+        """
+        GET url on the shared session, retrying 429/5xx and timeouts with backoff.
+        Each attempt first waits for room in the source's rate limit window.
+        
+        Returns:
+            (status, decoded JSON body or None when status is not 200)
+        """
+        session = await self._ensure_session()
+        
+        async def attempt():
+            await self._limiters[source].acquire()
+            async with self._controllers[source].slot():
+                async with session.get(url, params=params) as response:
+                    if response.status in RETRYABLE_STATUSES:
+                        response.raise_for_status()
+                    if response.status != 200:
+                        return response.status, None
+                    return response.status, loads(await response.read())
+        
+        return await with_backoff(attempt)
+    
+    async def close(self):
+        """Close the shared HTTP session."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
     
     async def get_prices(self, symbols: List[str]) -> Dict[str, Dict[str, float]]:
         """
         Fetch prices from multiple sources and return aggregated data.
         
+        All (symbol, source) requests for symbols missing from the cache
+        are issued concurrently, bounded by max_concurrency.
+        
         Args:
             symbols: List of cryptocurrency symbols (e.g., ['BTC', 'ETH'])
             
         Returns:
             Dict with structure: {symbol: {source: price}}
         """
+        self._bind_loop()
         results = {}
+        misses = []
+        now = time.monotonic()
         
         for symbol in symbols:
             # Check cache first
-            if self._is_cache_valid(symbol):
-                results[symbol] = self.price_cache[symbol]
+            cached = self._get_cached(symbol, now)
+            if cached is not None:
+                results[symbol] = cached
+            else:
+                misses.append(symbol)
+        
+        if not misses:
+            return results
+        
+        per_symbol = [
+            (symbol, source_name, self._guarded_fetch(fetch_func, symbol))
+            for symbol in misses
+            for source_name, fetch_func in self.sources.items()
+            if source_name not in self.batch_sources
+        ]
+        batched = [
+            (source_name, self._guarded_fetch(fetch_func, misses))
+            for source_name, fetch_func in self.batch_sources.items()
+        ]
+        outcomes = await asyncio.gather(
+            *(t for _, _, t in per_symbol), *(t for _, t in batched), return_exceptions=True
+        )
+        
+        # Flatten batch results into the same (symbol, source, price) shape
+        priced = [(symbol, source_name, price) for (symbol, source_name, _), price in zip(per_symbol, outcomes)]
+        for (source_name, _), batch in zip(batched, outcomes[len(per_symbol):]):
+            if isinstance(batch, BaseException):
+                logger.error(f"Error fetching {misses} from {source_name}: {batch}")
                 continue
-            
-            symbol_results = {}
-            
-            # Fetch from all sources
-            for source_name, fetch_func in self.sources.items():
-                try:
-                    price = await fetch_func(symbol)
-                    if price:
-                        symbol_results[source_name] = price
-                        logger.info(f"Fetched {symbol} price from {source_name}: ${price}")
-                except Exception as e:
-                    logger.error(f"Error fetching {symbol} from {source_name}: {e}")
-            
+            priced.extend((symbol, source_name, price) for symbol, price in batch.items())
+        
+        fetched: Dict[str, Dict[str, float]] = {symbol: {} for symbol in misses}
+        for symbol, source_name, price in priced:
+            if isinstance(price, BaseException):
+                logger.error(f"Error fetching {symbol} from {source_name}: {price}")
+            elif price:
+                fetched[symbol][source_name] = price
+                logger.debug("Fetched {} price from {}: ${}", symbol, source_name, price)
+        
+        for symbol, symbol_results in fetched.items():
             if symbol_results:
                 results[symbol] = symbol_results
-                self._update_cache(symbol, symbol_results)
+                self._update_cache(symbol, symbol_results, now)
         
         return results
     
+    async def _guarded_fetch(self, fetch_func, symbol: str) -> Optional[float]:
+        """Run a source fetch under the shared concurrency limit."""
+        async with self._semaphore:
+            return await fetch_func(symbol)
+    
     def verify_prices(self, prices: Dict[str, Dict[str, float]], 
                      max_deviation: float = 0.05) -> Dict[str, float]:
         """
@@ -70,6 +197,9 @@ class PriceFetcher:
         Returns:
             Dict with verified consensus prices
         """
+        if len(prices) >= _NUMPY_MIN_SYMBOLS:
+            return self._verify_prices_vectorized(prices, max_deviation)
+        
         verified_prices = {}
         
         for symbol, source_prices in prices.items():
@@ -94,7 +224,45 @@ class PriceFetcher:
             
             if valid_prices:
                 verified_prices[symbol] = sum(valid_prices) / len(valid_prices)
-                logger.info(f"Verified price for {symbol}: ${verified_prices[symbol]:.2f}")
+                logger.debug("Verified price for {}: ${:.2f}", symbol, verified_prices[symbol])
+            else:
+                logger.error(f"No valid prices for {symbol} - all sources deviate too much")
+        
+        return verified_prices
+    
+    def _verify_prices_vectorized(self, prices: Dict[str, Dict[str, float]],
+                                  max_deviation: float) -> Dict[str, float]:
+        """verify_prices for large watchlists: one symbols x sources array, NaN where missing."""
+        verified_prices = {}
+        multi = []
+        for symbol, source_prices in prices.items():
+            if len(source_prices) >= 2:
+                multi.append(symbol)
+            elif source_prices:
+                # If only one source, use it but mark as unverified
+                verified_prices[symbol] = next(iter(source_prices.values()))
+                logger.warning(f"Only one price source for {symbol}")
+        if not multi:
+            return verified_prices
+        
+        arr = np.full((len(multi), max(len(prices[s]) for s in multi)), np.nan)
+        for i, symbol in enumerate(multi):
+            values = list(prices[symbol].values())
+            arr[i, :len(values)] = values
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = np.nanmean(arr, axis=1, keepdims=True)
+            deviation = np.abs(arr - means) / means
+            valid = deviation <= max_deviation  # False for missing (NaN) cells
+            counts = valid.sum(axis=1)
+            consensus = np.where(valid, arr, 0.0).sum(axis=1) / counts
+        
+        for i, j in zip(*np.nonzero(~valid & ~np.isnan(arr))):
+            logger.warning(f"Price deviation for {multi[i]}: {deviation[i, j]:.2%}")
+        for i, symbol in enumerate(multi):
+            if counts[i]:
+                verified_prices[symbol] = float(consensus[i])
+                logger.debug("Verified price for {}: ${:.2f}", symbol, verified_prices[symbol])
             else:
                 logger.error(f"No valid prices for {symbol} - all sources deviate too much")
         
@@ -102,38 +270,42 @@ class PriceFetcher:
     
     async def _fetch_coingecko(self, symbol: str) -> Optional[float]:
         """Fetch price from CoinGecko API."""
+        prices = await self._fetch_coingecko_batch([symbol])
+        return prices.get(symbol)
+    
+    async def _fetch_coingecko_batch(self, symbols: List[str]) -> Dict[str, float]:
+        """Fetch prices for several symbols from CoinGecko in one request."""
         try:
-            coin_map = {
-                'BTC': 'bitcoin',
-                'ETH': 'ethereum',
-                'ADA': 'cardano',
-                'SOL': 'solana',
-                'MATIC': 'polygon'
-            }
-            
-            coin_id = coin_map.get(symbol.upper())
-            if not coin_id:
-                logger.error(f"Unsupported symbol for CoinGecko: {symbol}")
-                return None
+            ids = {}
+            for symbol in symbols:
+                coin_id = _COIN_MAP.get(symbol.upper())
+                if coin_id:
+                    ids[symbol] = coin_id
+                else:
+                    logger.error(f"Unsupported symbol for CoinGecko: {symbol}")
+            if not ids:
+                return {}
             
             url = f"https://api.coingecko.com/api/v3/simple/price"
             params = {
-                'ids': coin_id,
+                'ids': ",".join(set(ids.values())),
                 'vs_currencies': 'usd'
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return data[coin_id]['usd']
-                    else:
-                        logger.error(f"CoinGecko API error: {response.status}")
-                        return None
+            status, data = await self._get_json('coingecko', url, params)
+            if status == 200:
+                return {
+                    symbol: data[coin_id]['usd']
+                    for symbol, coin_id in ids.items()
+                    if coin_id in data
+                }
+            else:
+                logger.error(f"CoinGecko API error: {status}")
+                return {}
                         
         except Exception as e:
             logger.error(f"Error fetching from CoinGecko: {e}")
-            return None
+            return {}
     
     async def _fetch_coinbase(self, symbol: str) -> Optional[float]:
         """Fetch price from Coinbase Pro API."""
@@ -141,33 +313,27 @@ class PriceFetcher:
             product_id = f"{symbol.upper()}-USD"
             url = f"https://api.exchange.coinbase.com/products/{product_id}/ticker"
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return float(data['price'])
-                    else:
-                        logger.error(f"Coinbase API error: {response.status}")
-                        return None
+            status, data = await self._get_json('coinbase', url)
+            if status == 200:
+                return float(data['price'])
+            else:
+                logger.error(f"Coinbase API error: {status}")
+                return None
                         
         except Exception as e:
             logger.error(f"Error fetching from Coinbase: {e}")
             return None
     
-    def _is_cache_valid(self, symbol: str) -> bool:
-        """Check if cached price is still valid."""
-        if symbol not in self.price_cache:
-            return False
-        
-        if symbol not in self.last_fetch_time:
-            return False
-        
-        return time.time() - self.last_fetch_time[symbol] < self.cache_duration
+    def _get_cached(self, symbol: str, now: float) -> Optional[Dict[str, float]]:
+        """Return cached prices for symbol if they have not expired."""
+        entry = self._cache.get(symbol)
+        if entry and entry[0] > now:
+            return entry[1]
+        return None
     
-    def _update_cache(self, symbol: str, prices: Dict[str, float]):
+    def _update_cache(self, symbol: str, prices: Dict[str, float], now: float):
         """Update price cache."""
-        self.price_cache[symbol] = prices
-        self.last_fetch_time[symbol] = time.time()
+        self._cache[symbol] = (now + self.cache_duration, prices)
 
 
 if __name__ == "__main__":
@@ -177,9 +343,11 @@ if __name__ == "__main__":
         symbols = ['BTC', 'ETH']
         
         prices = await fetcher.get_prices(symbols)
-        print("Raw prices:", json.dumps(prices, indent=2))
+        print("Raw prices:", dumps_pretty(prices))
         
         verified = fetcher.verify_prices(prices)
-        print("Verified prices:", json.dumps(verified, indent=2))
+        print("Verified prices:", dumps_pretty(verified))
+        
+        await fetcher.close()
     
     asyncio.run(test_price_fetcher())
\ No newline at end of file
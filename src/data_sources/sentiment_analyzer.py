@@ -3,14 +3,97 @@ Sentiment analysis module for cryptocurrency market sentiment.
 """
 import asyncio
 import aiohttp
-import requests
 import time
-import json
+import numpy as np
 from typing import Dict, List, Optional, Tuple
 from loguru import logger
 import os
+import random
+import re
+import string
+from collections import OrderedDict
 from datetime import datetime, timedelta
 
+from common.fastjson import dumps_pretty, loads
+from common.retry import RETRYABLE_STATUSES, with_backoff
+
+try:
+    import ahocorasick  # optional: single-pass multi-keyword matching
+except ImportError:
+    ahocorasick = None
+
+
+# Keyword vocabularies for the headline sentiment heuristic
+POSITIVE_KEYWORDS = frozenset({
+    'bull', 'bullish', 'rally', 'surge', 'moon', 'pump', 'gains',
+    'profit', 'buy', 'investing', 'adoption', 'breakthrough', 'success'
+})
+
+NEGATIVE_KEYWORDS = frozenset({
+    'bear', 'bearish', 'crash', 'dump', 'sell', 'loss', 'decline',
+    'fall', 'drop', 'risk', 'regulation', 'ban', 'hack', 'scam'
+})
+
+# NewsAPI search terms for different cryptocurrencies
+SEARCH_TERMS = {
+    'BTC': 'Bitcoin OR BTC',
+    'ETH': 'Ethereum OR ETH',
+    'ADA': 'Cardano OR ADA',
+    'SOL': 'Solana OR SOL',
+    'MATIC': 'Polygon OR MATIC'
+}
+
+NEWS_API_URL = "https://newsapi.org/v2/everything"
+NEWS_API_MAX_QUERY = 500  # NewsAPI's limit on the q= parameter
+NEWS_PAGE_SIZE = 20  # articles per single-symbol query
+NEWS_BATCH_PAGE_SIZE = 100  # NewsAPI's maximum pageSize
+# Symbols per combined query, so each still gets about NEWS_PAGE_SIZE articles
+NEWS_BATCH_SYMBOLS = NEWS_BATCH_PAGE_SIZE // NEWS_PAGE_SIZE
+
+_TOKEN_RE = re.compile(r"[a-z]+")
+_WORD_CHARS = frozenset(string.ascii_lowercase)
+
+
+def _build_keyword_automaton():
+    """Aho-Corasick automaton over both vocabularies, or None without pyahocorasick."""
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for keyword in POSITIVE_KEYWORDS:
+        automaton.add_word(keyword, (True, keyword))
+    for keyword in NEGATIVE_KEYWORDS:
+        automaton.add_word(keyword, (False, keyword))
+    automaton.make_automaton()
+    return automaton
+
+
+_KEYWORD_AUTOMATON = _build_keyword_automaton()
+
+
+def _keyword_hits(content: str) -> Tuple[int, int]:
+    """
+    Count distinct whole-word positive and negative keywords in lowercased text.
+    
+    Uses one Aho-Corasick pass when pyahocorasick is installed (which also
+    handles multi-word phrases), otherwise token-set intersection.
+    """
+    if _KEYWORD_AUTOMATON is None:
+        tokens = set(_TOKEN_RE.findall(content))
+        return len(POSITIVE_KEYWORDS & tokens), len(NEGATIVE_KEYWORDS & tokens)
+    
+    hits = set()
+    last = len(content) - 1
+    for end, (positive, keyword) in _KEYWORD_AUTOMATON.iter(content):
+        start = end - len(keyword) + 1
+        # Only whole words count, matching the tokenizer fallback
+        if start > 0 and content[start - 1] in _WORD_CHARS:
+            continue
+        if end < last and content[end + 1] in _WORD_CHARS:
+            continue
+        hits.add((positive, keyword))
+    positive_score = sum(1 for positive, _ in hits if positive)
+    return positive_score, len(hits) - positive_score
+
 
 class SentimentAnalyzer:
     """Analyzes cryptocurrency sentiment from news and social media sources."""
@@ -18,8 +101,27 @@ class SentimentAnalyzer:
     def __init__(self, news_api_key: Optional[str] = None):
         self.news_api_key = news_api_key or os.getenv('NEWS_API_KEY')
         self.cache_duration = 1800  # 30 minutes cache
-        self.sentiment_cache = {}
-        self.last_fetch_time = {}
+        self.error_cache_duration = 300  # retry failed symbols after 5 minutes
+        self.cache_size = 1024  # least recently used symbols are evicted beyond this
+        self._cache: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()  # symbol -> (monotonic deadline, sentiment)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._date_cache: Tuple[int, str, str] = (-1, '', '')  # (minute, from, to)
+    
+    async def _ensure_session(self) -> aiohttp.ClientSession:
+        """Return the shared HTTP session, creating it on first use."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=20, limit_per_host=8, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=30)
+            )
+        return self._session
+    
+    async def close(self):
+        """Close the shared HTTP session."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
     
     async def get_sentiment_data(self, symbols: List[str]) -> Dict[str, Dict]:
         """
@@ -32,34 +134,97 @@ class SentimentAnalyzer:
             Dict with sentiment scores and analysis
         """
         results = {}
+        to_fetch = []
         
         for symbol in symbols:
             # Check cache first
-            if self._is_cache_valid(symbol):
-                results[symbol] = self.sentiment_cache[symbol]
-                continue
-            
-            try:
-                # Fetch news sentiment
-                news_sentiment = await self._fetch_news_sentiment(symbol)
-                
-                # Fetch social sentiment (placeholder for reddit/twitter)
-                social_sentiment = await self._fetch_social_sentiment(symbol)
-                
-                # Combine sentiments
-                combined_sentiment = self._combine_sentiments(news_sentiment, social_sentiment)
-                
-                results[symbol] = combined_sentiment
-                self._update_cache(symbol, combined_sentiment)
-                
-                logger.info(f"Fetched sentiment for {symbol}: {combined_sentiment['overall_score']:.2f}")
-                
-            except Exception as e:
-                logger.error(f"Error fetching sentiment for {symbol}: {e}")
-                results[symbol] = self._get_neutral_sentiment()
+            cached = self._get_cached(symbol)
+            if cached is not None:
+                results[symbol] = cached
+            else:
+                to_fetch.append(symbol)
+        
+        # Claim symbols nobody else is fetching before the combined NewsAPI query,
+        # so concurrent callers wait on this fetch instead of starting their own
+        loop = asyncio.get_running_loop()
+        owned: Dict[str, asyncio.Future] = {}
+        for symbol in to_fetch:
+            if symbol not in self._inflight:
+                owned[symbol] = self._inflight[symbol] = loop.create_future()
+        claimed = list(owned)
+        chunks = [claimed[i:i + NEWS_BATCH_SYMBOLS] for i in range(0, len(claimed), NEWS_BATCH_SYMBOLS)]
+        articles: Dict[str, List[Dict]] = {}
+        try:
+            for batch in await asyncio.gather(*(
+                self._fetch_news_batch(chunk) for chunk in chunks if len(chunk) > 1
+            )):
+                articles.update(batch)
+        except BaseException:
+            for symbol, fut in owned.items():
+                self._inflight.pop(symbol, None)
+                fut.cancel()
+            raise
+        
+        # Uncached symbols are fetched concurrently over the shared session; each
+        # claimed future is handed to the first occurrence of its symbol only.
+        # A symbol the combined query found no articles for gets its own query,
+        # so busier symbols can't crowd it out of the shared page.
+        fetched = await asyncio.gather(*(
+            self._fetch_symbol(symbol, articles.get(symbol) or None, owned.pop(symbol, None))
+            for symbol in to_fetch
+        ))
+        results.update(fetched)
         
         return results
     
+    async def _fetch_symbol(self, symbol: str, articles: Optional[List[Dict]] = None,
+                            fut: Optional[asyncio.Future] = None) -> Tuple[str, Dict]:
+        """
+        Return (symbol, sentiment), sharing one in-flight fetch per symbol so
+        concurrent callers with an expired cache make a single API request.
+        Pre-fetched news articles, when given, replace the per-symbol query.
+        `fut` is the in-flight future this caller already registered, if any.
+        """
+        if fut is None:
+            fut = self._inflight.get(symbol)
+            if fut is not None:
+                return symbol, await asyncio.shield(fut)
+            fut = self._inflight[symbol] = asyncio.get_running_loop().create_future()
+        
+        try:
+            sentiment = await self._load_symbol(symbol, articles)
+            fut.set_result(sentiment)
+            return symbol, sentiment
+        finally:
+            self._inflight.pop(symbol, None)
+            if not fut.done():
+                fut.cancel()
+    
+    async def _load_symbol(self, symbol: str, articles: Optional[List[Dict]] = None) -> Dict:
+        """Fetch, combine and cache sentiment for one symbol; neutral on failure."""
+        try:
+            # Fetch news sentiment
+            if articles is not None:
+                news_sentiment = self._analyze_news_sentiment(articles)
+            else:
+                news_sentiment = await self._fetch_news_sentiment(symbol)
+            
+            # Fetch social sentiment (placeholder for reddit/twitter)
+            social_sentiment = await self._fetch_social_sentiment(symbol)
+            
+            # Combine sentiments
+            combined_sentiment = self._combine_sentiments(news_sentiment, social_sentiment)
+            self._update_cache(symbol, combined_sentiment)
+            
+            logger.info("Fetched sentiment for {}: {:.2f}", symbol, combined_sentiment['overall_score'])
+            return combined_sentiment
+            
+        except Exception as e:
+            logger.error(f"Error fetching sentiment for {symbol}: {e}")
+            neutral = self._get_neutral_sentiment()
+            self._update_cache(symbol, neutral, ttl=self.error_cache_duration)
+            return neutral
+    
     async def _fetch_news_sentiment(self, symbol: str) -> Dict:
         """Fetch news sentiment for a cryptocurrency."""
         if not self.news_api_key:
@@ -67,45 +232,96 @@ class SentimentAnalyzer:
             return self._get_placeholder_news_sentiment(symbol)
         
         try:
-            # Calculate date range (last 24 hours)
-            to_date = datetime.now()
-            from_date = to_date - timedelta(days=1)
-            
-            # Search terms for different cryptocurrencies
-            search_terms = {
-                'BTC': 'Bitcoin OR BTC',
-                'ETH': 'Ethereum OR ETH',
-                'ADA': 'Cardano OR ADA',
-                'SOL': 'Solana OR SOL',
-                'MATIC': 'Polygon OR MATIC'
-            }
-            
-            query = search_terms.get(symbol.upper(), symbol)
-            
-            url = "https://newsapi.org/v2/everything"
-            params = {
-                'q': query,
-                'from': from_date.strftime('%Y-%m-%d'),
-                'to': to_date.strftime('%Y-%m-%d'),
-                'sortBy': 'popularity',
-                'language': 'en',
-                'apiKey': self.news_api_key,
-                'pageSize': 20
-            }
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return self._analyze_news_sentiment(data['articles'])
-                    else:
-                        logger.error(f"News API error: {response.status}")
-                        return self._get_placeholder_news_sentiment(symbol)
+            status, data = await self._query_news(SEARCH_TERMS.get(symbol.upper(), symbol), page_size=NEWS_PAGE_SIZE)
+            if status == 200:
+                return self._analyze_news_sentiment(data['articles'])
+            else:
+                logger.error(f"News API error: {status}")
+                return self._get_placeholder_news_sentiment(symbol)
                         
         except Exception as e:
             logger.error(f"Error fetching news sentiment: {e}")
             return self._get_placeholder_news_sentiment(symbol)
     
+    async def _fetch_news_batch(self, symbols: List[str]) -> Dict[str, List[Dict]]:
+        """
+        Fetch news for several symbols with one OR-combined NewsAPI query and
+        assign each article to the symbols whose search terms it mentions.
+        
+        Returns an empty dict (so callers fall back to per-symbol queries) when
+        there is no API key, the query would exceed NewsAPI's length limit, or
+        the request fails. Callers pass at most NEWS_BATCH_SYMBOLS symbols.
+        """
+        if not self.news_api_key:
+            return {}
+        
+        terms = {symbol: SEARCH_TERMS.get(symbol.upper(), symbol) for symbol in symbols}
+        query = " OR ".join(f"({term})" for term in terms.values())
+        if len(query) > NEWS_API_MAX_QUERY:
+            return {}
+        
+        try:
+            status, data = await self._query_news(query, page_size=NEWS_BATCH_PAGE_SIZE)
+        except Exception as e:
+            logger.error(f"Error fetching batched news: {e}")
+            return {}
+        if status != 200:
+            logger.error(f"News API error: {status}")
+            return {}
+        
+        words = {
+            symbol: frozenset(word.lower() for word in term.split(" OR "))
+            for symbol, term in terms.items()
+        }
+        articles: Dict[str, List[Dict]] = {symbol: [] for symbol in symbols}
+        for article in data['articles']:
+            text = f"{article.get('title') or ''} {article.get('description') or ''}".lower()
+            tokens = set(_TOKEN_RE.findall(text))
+            for symbol, symbol_words in words.items():
+                if symbol_words & tokens:
+                    articles[symbol].append(article)
+        return articles
+    
+    async def _query_news(self, query: str, page_size: int) -> Tuple[int, Optional[Dict]]:
+        """
+        Run a NewsAPI /everything search over the last 24 hours.
+        
+        Returns:
+            (status, decoded JSON body or None when status is not 200)
+        """
+        from_str, to_str = self._date_range()
+        params = {
+            'q': query,
+            'from': from_str,
+            'to': to_str,
+            'sortBy': 'popularity',
+            'language': 'en',
+            'apiKey': self.news_api_key,
+            'pageSize': page_size
+        }
+        
+        session = await self._ensure_session()
+        
+        async def attempt():
+            async with session.get(NEWS_API_URL, params=params) as response:
+                if response.status in RETRYABLE_STATUSES:
+                    response.raise_for_status()
+                if response.status != 200:
+                    return response.status, None
+                return response.status, loads(await response.read())
+        
+        # Short backoff: a stale sentiment read beats a long stall
+        return await with_backoff(attempt, max_retries=3, base=0.05, max_delay=2.0)
+    
+    def _date_range(self) -> Tuple[str, str]:
+        """NewsAPI from/to dates covering the last 24 hours, recomputed once a minute."""
+        minute = int(time.time() // 60)
+        if self._date_cache[0] != minute:
+            to_date = datetime.now()
+            from_date = to_date - timedelta(days=1)
+            self._date_cache = (minute, from_date.strftime('%Y-%m-%d'), to_date.strftime('%Y-%m-%d'))
+        return self._date_cache[1], self._date_cache[2]
+    
     async def _fetch_social_sentiment(self, symbol: str) -> Dict:
         """Fetch social media sentiment (placeholder implementation)."""
         # This is a placeholder for social media sentiment
@@ -129,41 +345,20 @@ class SentimentAnalyzer:
                 'confidence': 0.0
             }
         
-        # Simple sentiment analysis based on keywords
-        positive_keywords = [
-            'bull', 'bullish', 'rally', 'surge', 'moon', 'pump', 'gains', 
-            'profit', 'buy', 'investing', 'adoption', 'breakthrough', 'success'
-        ]
-        
-        negative_keywords = [
-            'bear', 'bearish', 'crash', 'dump', 'sell', 'loss', 'decline',
-            'fall', 'drop', 'risk', 'regulation', 'ban', 'hack', 'scam'
-        ]
-        
-        sentiment_scores = []
-        positive_count = 0
-        negative_count = 0
-        neutral_count = 0
-        
-        for article in articles:
-            title = article.get('title', '').lower()
-            description = article.get('description', '').lower()
-            content = f"{title} {description}"
-            
-            positive_score = sum(1 for keyword in positive_keywords if keyword in content)
-            negative_score = sum(1 for keyword in negative_keywords if keyword in content)
-            
-            if positive_score > negative_score:
-                sentiment_scores.append(1)
-                positive_count += 1
-            elif negative_score > positive_score:
-                sentiment_scores.append(-1)
-                negative_count += 1
-            else:
-                sentiment_scores.append(0)
-                neutral_count += 1
+        # Per-article (positive, negative) keyword hits, then vectorized tallies
+        hits = np.zeros((len(articles), 2), dtype=np.int16)
+        for i, article in enumerate(articles):
+            # NewsAPI sends null for missing fields; articles with no text stay neutral
+            title = article.get('title') or ''
+            description = article.get('description') or ''
+            if title or description:
+                hits[i] = _keyword_hits(f"{title} {description}".lower())
+        signs = np.sign(hits[:, 0] - hits[:, 1])
         
-        avg_sentiment = sum(sentiment_scores) / len(sentiment_scores) if sentiment_scores else 0
+        positive_count = int((signs > 0).sum())
+        negative_count = int((signs < 0).sum())
+        neutral_count = len(articles) - positive_count - negative_count
+        avg_sentiment = float(signs.mean())
         
         return {
             'score': avg_sentiment,
@@ -233,21 +428,30 @@ class SentimentAnalyzer:
             'interpretation': "Neutral"
         }
     
-    def _is_cache_valid(self, symbol: str) -> bool:
-        """Check if cached sentiment is still valid."""
-        if symbol not in self.sentiment_cache:
-            return False
-        
-        if symbol not in self.last_fetch_time:
-            return False
-        
-        return time.time() - self.last_fetch_time[symbol] < self.cache_duration
+    def _get_cached(self, symbol: str) -> Optional[Dict]:
+        """Return cached sentiment if still valid, refreshing its LRU position."""
+        hit = self._cache.get(symbol)
+        if hit is None:
+            return None
+        if time.monotonic() >= hit[0]:
+            del self._cache[symbol]
+            return None
+        self._cache.move_to_end(symbol)
+        return hit[1]
     
-    def _update_cache(self, symbol: str, sentiment: Dict):
-        """Update sentiment cache."""
-        self.sentiment_cache[symbol] = sentiment
-        self.last_fetch_time[symbol] = time.time()
-
+    def _update_cache(self, symbol: str, sentiment: Dict, ttl: Optional[float] = None):
+        """
+        Update sentiment cache, evicting the least recently used entries
+        beyond cache_size.
+        
+        The TTL (cache_duration unless given) is jittered by +/-10% per entry
+        so symbols fetched together don't all expire at the same instant.
+        """
+        ttl = self.cache_duration if ttl is None else ttl
+        self._cache[symbol] = (time.monotonic() + ttl * random.uniform(0.9, 1.1), sentiment)
+        self._cache.move_to_end(symbol)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
 
 if __name__ == "__main__":
     # Test the sentiment analyzer
@@ -255,7 +459,10 @@ if __name__ == "__main__":
         analyzer = SentimentAnalyzer()
         symbols = ['BTC', 'ETH']
         
-        sentiment_data = await analyzer.get_sentiment_data(symbols)
-        print("Sentiment data:", json.dumps(sentiment_data, indent=2))
+        try:
+            sentiment_data = await analyzer.get_sentiment_data(symbols)
+            print("Sentiment data:", dumps_pretty(sentiment_data))
+        finally:
+            await analyzer.close()
     
     asyncio.run(test_sentiment_analyzer())
\ No newline at end of file
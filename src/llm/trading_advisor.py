@@ -1,23 +1,241 @@
 """
 LLM integration module for trading decision making.
 """
+import asyncio
+import contextlib
+import hashlib
 import os
 import json
-from typing import Dict, Any, Optional
+import math
+import re
+import time
+from collections import OrderedDict
+from typing import Callable, ClassVar, Dict, Any, List, Optional, Tuple
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
 from loguru import logger
 
+from common.async_http import close_shared_session, post_sse, shared_session
+from common.fastjson import dumps, loads
+from common.rate_limit import SlidingWindowLimiter
+from common.retry import with_backoff, with_backoff_sync
+
+# One pass picks up action words and the stated confidence ("Confidence: 78",
+# "confidence level of 78.5%" or a bare "78%"). The confidence prefix is a
+# lookahead so action words after it are still scanned.
+_SIGNAL_RE = re.compile(
+    r"(?P<action>\bbuy|\bsell)"
+    r"|confidence(?=\D{0,20}?(?P<conf>\d{1,3}(?:\.\d+)?))"
+    r"|(?P<pct>\d{1,3}(?:\.\d+)?)\s*%",
+    re.I,
+)
+_ACTIONS = ("BUY", "SELL", "HOLD")
+
+# Replies that follow the requested {"symbol", "action", "confidence", "reason"}
+# shape are read field-by-field in one search; anything else goes through a
+# full JSON parse and then the free-text scan.
+_JSON_FIELDS_RE = re.compile(
+    r'"(?:action|recommendation)"\s*:\s*"(?P<action>[A-Za-z]+)"\s*,\s*'
+    r'"confidence"\s*:\s*(?P<conf>-?\d+(?:\.\d+)?)\s*,\s*'
+    r'"(?:reason|explanation)"\s*:\s*"(?P<reason>(?:[^"\\]|\\.)*)"'
+)
+
+# Market-data sections of the completions prompt, rendered with one format call each
+_PRICE_TEMPLATE = (
+    "Current Price: ${current_price}\n"
+    "Price Sources: {sources}\n"
+    "Price Verification: {verification}\n"
+)
+_SENTIMENT_HEADER = "\n=== SENTIMENT ANALYSIS ==="
+_SENTIMENT_TEMPLATE = "\nSentiment Score: {score}\nSentiment Sources: {sources}"
+
+# Relative width of the buckets _quantize puts floats in for cache keys
+_QUANTIZE_STEP = math.log1p(0.001)
+
+# Neutral fallback, copied per symbol; key order matches the parsed recommendations
+_MOCK_RECOMMENDATION = {
+    "symbol": "UNKNOWN",
+    "action": "HOLD",
+    "confidence": 0.0,
+    "reason": "LLM endpoint not configured or response could not be parsed."
+}
+
+
+def _text_recommendation(text: str, symbol: str, reason: str) -> Dict[str, Any]:
+    """
+    Recommendation from free text: BUY or SELL when only one of them is
+    mentioned (otherwise HOLD), and the first stated confidence within 0-100.
+    """
+    buy = sell = False
+    confidence = None
+    for m in _SIGNAL_RE.finditer(text):
+        word = m.group("action")
+        if word:
+            if word[0] in "bB":
+                buy = True
+            else:
+                sell = True
+        elif confidence is None:
+            value = float(m.group("conf") or m.group("pct"))
+            if 0.0 <= value <= 100.0:
+                confidence = value
+    action = "BUY" if buy and not sell else "SELL" if sell and not buy else "HOLD"
+    return {
+        "symbol": symbol,
+        "action": action,
+        "confidence": confidence or 0.0,
+        "reason": reason,
+    }
+
+
+class _JsonBlockScanner:
+    """Spots the first complete top-level JSON object or array in streamed text."""
+
+    def __init__(self):
+        self._parts: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> Optional[str]:
+        """Consume the next chunk; returns the block's text once it has closed."""
+        for ch in chunk:
+            if self._depth == 0:
+                if ch in "{[":
+                    self._depth = 1
+                    self._parts = [ch]
+                continue
+            self._parts.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    return "".join(self._parts)
+        return None
+
+
+def _quantize(value: Any) -> Any:
+    """
+    Context with floats rounded down onto a ~0.1% logarithmic grid and
+    timestamps dropped, so near-identical market snapshots compare equal
+    while a material price move (BTC 65,432 vs 65,380) does not.
+    """
+    if isinstance(value, dict):
+        return {k: _quantize(v) for k, v in value.items() if k != 'timestamp'}
+    if isinstance(value, (list, tuple)):
+        return [_quantize(v) for v in value]
+    if isinstance(value, float) and value != 0.0 and math.isfinite(value):
+        bucket = math.floor(math.log(abs(value)) / _QUANTIZE_STEP)
+        return math.copysign(math.exp(bucket * _QUANTIZE_STEP), value)
+    return value
+
+
+def _fields_recommendation(fields: Dict[str, Any], symbol: str) -> Dict[str, Any]:
+    """Recommendation from a dict with action/recommendation, confidence and reason keys."""
+    action = str(fields.get("action") or fields.get("recommendation") or "HOLD").upper()
+    confidence = float(fields.get("confidence", 0.0))
+    return {
+        "symbol": symbol,
+        "action": action if action in _ACTIONS else "HOLD",
+        "confidence": max(0.0, min(100.0, confidence)),
+        "reason": fields.get("reason") or fields.get("explanation") or "No reason provided.",
+    }
+
+
+def _json_fields(text: str) -> Optional[Dict[str, Any]]:
+    """Fields of a recommendation JSON object embedded in the reply text, or None."""
+    m = _JSON_FIELDS_RE.search(text)
+    if m:
+        reason = m.group("reason")
+        if "\\" in reason:
+            reason = loads(f'"{reason}"')
+        return {"action": m.group("action"), "confidence": m.group("conf"), "reason": reason}
+
+    start = text.find("{")
+    if start < 0:
+        return None
+    try:
+        fields = loads(text[start:text.rfind("}") + 1])
+    except ValueError:
+        return None
+    if isinstance(fields, dict) and ("action" in fields or "recommendation" in fields):
+        return fields
+    return None
+
+
+def _json_recommendation(text: str, symbol: str) -> Optional[Dict[str, Any]]:
+    """Recommendation from a JSON object embedded in the reply text, or None."""
+    fields = _json_fields(text)
+    return None if fields is None else _fields_recommendation(fields, symbol)
+
+
+def _validated_recommendation(response: Any, symbol: str) -> Optional[Dict[str, Any]]:
+    """
+    Recommendation from a well-formed reply only: a decision for symbol, a
+    completions JSON object or a flat dict, whose action is BUY/SELL/HOLD and
+    whose confidence is numeric. None for anything the lenient
+    _parse_llm_response would have to guess at.
+    """
+    fields = None
+    if isinstance(response, str):
+        fields = _json_fields(response)
+    elif isinstance(response, dict):
+        decisions, choices = response.get("decisions"), response.get("choices")
+        if isinstance(decisions, list):
+            fields = next((d for d in decisions if isinstance(d, dict)
+                           and str(d.get("symbol") or "").upper() == str(symbol).upper()), None)
+        elif isinstance(choices, list):
+            choice = choices[0] if choices and isinstance(choices[0], dict) else {}
+            fields = _json_fields(choice.get("text") or (choice.get("message") or {}).get("content") or "")
+        else:
+            fields = response
+    if not isinstance(fields, dict):
+        return None
+    action = fields.get("action") or fields.get("recommendation")
+    if not isinstance(action, str) or action.upper() not in _ACTIONS:
+        return None
+    try:
+        float(fields["confidence"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    return _fields_recommendation(fields, symbol)
+
 
 class LLMTradingAdvisor:
     """Uses LLM to analyze market data and provide trading recommendations."""
 
+    # Keep-alive sessions shared by every advisor in the process, one per
+    # endpoint, so advisors created per symbol or strategy reuse warm connections
+    _http_sessions: ClassVar[Dict[str, requests.Session]] = {}
+
     def __init__(self, endpoint_url: Optional[str] = None, model: str = "Meta-Llama-3.1-8B-Instruct-Q4_K_M"):
         # Prefer env overrides when present
         self.endpoint_url = endpoint_url or os.getenv('LLM_ENDPOINT_URL')
         self.model = os.getenv('LLM_MODEL', model)
+        # Optional cheaper model raced against self.model by the async path
+        self.fast_model = os.getenv('LLM_FAST_MODEL') or None
 
         if not self.endpoint_url:
             logger.error("LM Studio endpoint URL not provided. Ensure LLM_ENDPOINT_URL is set.")
 
+        self._http = self._shared_http(self.endpoint_url or "")
+        self._timeout = aiohttp.ClientTimeout(total=60)
+
+        # Client-side request/token budgets per minute; tokens estimated as bytes / 4
+        self._rpm_limiter = SlidingWindowLimiter(int(os.getenv('LLM_RPM_LIMIT', '500')))
+        self._tpm_limiter = SlidingWindowLimiter(int(os.getenv('LLM_TPM_LIMIT', '200000')))
+
         self.system_prompt = """You are a professional cryptocurrency trading advisor with expertise in technical analysis, market sentiment, and risk management. 
 Your role is to analyze provided market data, sentiment analysis, portfolio information, and risk metrics to make informed trading decisions.
 Provide: 
@@ -25,6 +243,33 @@ Provide:
 2. Confidence level (0-100%).
 3. Detailed reasoning."""
 
+        # Opt-in for decision endpoints that remember prompts by hash: after the
+        # first accepted request only the hash is sent, until the server replies
+        # {"error": "unknown_prompt"} and the full prompt is resent.
+        self.prompt_hash_enabled = os.getenv('LLM_PROMPT_HASH', 'false').lower() == 'true'
+        # Decision endpoints that accept "context" as a JSON object rather than
+        # a JSON-encoded string skip the inner serialize and string escaping.
+        self.structured_context = os.getenv('LLM_STRUCTURED_CONTEXT', 'false').lower() == 'true'
+        # Stream completions-style replies as server-sent events
+        self.stream = os.getenv('LLM_STREAM', 'false').lower() == 'true'
+        self._prompt_hash = hashlib.blake2b(self.system_prompt.encode(), digest_size=16).hexdigest()
+        self._prompt_registered = False
+
+        # Completions prompt template, compiled once. Everything up to the symbol
+        # is identical across calls, so provider-side prompt-prefix caching can
+        # reuse it; per-symbol data only follows.
+        prompt_head = (f"{self.system_prompt}\n\n"
+                       "Please analyze the following market data and provide a trading recommendation:\n\n"
+                       "Symbol: ")
+        self._prompt_template = (prompt_head.replace("{", "{{").replace("}", "}}")
+                                 + "{symbol}\n\n=== PRICE DATA ===\n{market_data}")
+
+        # Recommendations for near-identical contexts (see _quantize) are reused
+        # briefly; kept short because the market moves
+        self.cache_ttl = float(os.getenv('LLM_RECOMMENDATION_CACHE_TTL', '60'))
+        self.cache_size = 256
+        self._cache: "OrderedDict[bytes, tuple]" = OrderedDict()  # key -> (monotonic deadline, recommendation)
+
     def get_trading_recommendation(self, context: Dict[str, Any]) -> Dict[str, Any]:
         """
         Get trading recommendation from LLM based on market context.
@@ -33,55 +278,396 @@ Provide:
             if not self.endpoint_url:
                 return self._get_mock_recommendation(context)
 
+            key = self._cache_key(context)
+            cached = self._get_cached(key)
+            if cached is not None:
+                return cached
+
             # Send request to LLM endpoint
             response = self._query_llm(context)
 
             # Parse response
-            return self._parse_llm_response(response, context)
+            recommendation = self._parse_llm_response(response, context)
+            self._update_cache(key, recommendation)
+            return recommendation
 
         except Exception as e:
             logger.error(f"Error getting LLM recommendation: {e}")
             return self._get_mock_recommendation(context)
 
-    def _query_llm(self, context: Dict[str, Any]) -> Any:
+    async def get_trading_recommendation_async(self, context: Dict[str, Any]) -> Dict[str, Any]:
         """
-        Query endpoint with the market context.
+        Non-blocking get_trading_recommendation over the advisor's aiohttp session.
+        """
+        try:
+            if not self.endpoint_url:
+                return self._get_mock_recommendation(context)
+
+            key = self._cache_key(context)
+            cached = self._get_cached(key)
+            if cached is not None:
+                return cached
+
+            if self.fast_model and self.fast_model != self.model:
+                recommendation, from_fast = await self._race_models(context)
+                # The cache key names self.model, so fast_model answers aren't stored under it
+                if not from_fast:
+                    self._update_cache(key, recommendation)
+                return recommendation
+
+            response = await self._aquery_llm(context)
+            recommendation = self._parse_llm_response(response, context)
+            self._update_cache(key, recommendation)
+            return recommendation
+
+        except Exception as e:
+            logger.error(f"Error getting LLM recommendation: {e}")
+            return self._get_mock_recommendation(context)
+
+    async def _race_models(self, context: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        """
+        Ask fast_model and model concurrently and return the first usable reply,
+        cancelling the other request. A fast_model reply only counts if it passes
+        _validated_recommendation; otherwise the race waits for model, whose
+        reply is parsed as usual. Returns (recommendation, whether fast_model
+        answered); raises the last error if neither reply is usable.
+        """
+        symbol = context.get('symbol', 'UNKNOWN')
+
+        async def ask(model: str) -> Dict[str, Any]:
+            response = await self._aquery_llm(context, model)
+            if model == self.model:
+                return self._parse_llm_response(response, context)
+            recommendation = _validated_recommendation(response, symbol)
+            if recommendation is None:
+                raise ValueError(f"Unusable reply from {model}")
+            return recommendation
+
+        is_fast = {asyncio.create_task(ask(self.fast_model)): True, asyncio.create_task(ask(self.model)): False}
+        pending = set(is_fast)
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result(), is_fast[task]
+                    error = task.exception()
+                    logger.debug("Race entry failed: {}", error)
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def get_trading_recommendations(self, contexts: List[Dict[str, Any]],
+                                          max_concurrency: int = 20) -> List[Dict[str, Any]]:
+        """
+        Get recommendations for several contexts concurrently, with at most
+        max_concurrency requests in flight.
+
+        Returns one recommendation per context, in the same order.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def bounded(context: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.get_trading_recommendation_async(context)
+
+        return list(await asyncio.gather(*(bounded(context) for context in contexts)))
+
+    async def get_trading_recommendations_batch(self, contexts: List[Dict[str, Any]],
+                                                batch_size: int = 8) -> List[Dict[str, Any]]:
+        """
+        Get recommendations with up to batch_size symbols per LLM request, so
+        the system prompt is sent once per batch instead of once per symbol.
+
+        A batch whose reply doesn't cover every symbol is retried one symbol
+        per request. Returns one recommendation per context, in the same order.
+        """
+        if not self.endpoint_url:
+            return [self._get_mock_recommendation(context) for context in contexts]
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(contexts)
+        keys = [self._cache_key(context) for context in contexts]
+        pending = []
+        for i, key in enumerate(keys):
+            results[i] = self._get_cached(key)
+            if results[i] is None:
+                pending.append(i)
+
+        batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+        replies = await asyncio.gather(*(
+            self._query_batch([contexts[i] for i in batch]) for batch in batches
+        ))
+        for batch, recommendations in zip(batches, replies):
+            if recommendations is None:
+                recommendations = await self.get_trading_recommendations([contexts[i] for i in batch])
+            for i, recommendation in zip(batch, recommendations):
+                self._update_cache(keys[i], recommendation)
+                results[i] = recommendation
+        return results
+
+    async def _query_batch(self, contexts: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """One request for several contexts; None if the reply can't be mapped back."""
+        if len(contexts) == 1:
+            return None
+        try:
+            response = await self._apost(lambda: self._build_batch_payload(contexts), stop_at_json=True)
+        except Exception as e:
+            logger.error(f"Batched LLM request failed: {e}")
+            return None
+
+        if self._is_decision_endpoint():
+            decisions = response.get("decisions") if isinstance(response, dict) else None
+            if not isinstance(decisions, list):
+                return None
+            answered = {str(d.get("symbol") or "").upper() for d in decisions if isinstance(d, dict)}
+            if any(str(c.get('symbol', 'UNKNOWN')).upper() not in answered for c in contexts):
+                return None
+            return [self._parse_llm_response(response, context) for context in contexts]
+
+        # Completions reply: a JSON array with one object per symbol, in order
+        choices = response.get("choices") if isinstance(response, dict) else None
+        if not isinstance(choices, list) or not choices or not isinstance(choices[0], dict):
+            return None
+        text = choices[0].get("text") or (choices[0].get("message") or {}).get("content") or ""
+        if not isinstance(text, str):
+            return None
+        try:
+            items = loads(text[text.index("["):text.rindex("]") + 1])
+        except ValueError:
+            return None
+        if not isinstance(items, list) or len(items) != len(contexts):
+            return None
+        # Any malformed item (bad action, non-numeric confidence) sends the batch per symbol
+        recommendations = [
+            _validated_recommendation(item, context.get('symbol', 'UNKNOWN'))
+            for item, context in zip(items, contexts)
+        ]
+        return None if None in recommendations else recommendations
+
+    def _cache_key(self, context: Dict[str, Any]) -> bytes:
+        """Digest of the quantized context plus everything else that shapes the request."""
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f"{self.endpoint_url}\0{self.model}\0{self._prompt_hash}\0".encode())
+        h.update(dumps(_quantize(context)).encode())
+        return h.digest()
+
+    def _get_cached(self, key: bytes) -> Optional[Dict[str, Any]]:
+        """Return a copy of a still-valid cached recommendation."""
+        hit = self._cache.get(key)
+        if hit is None:
+            return None
+        if time.monotonic() >= hit[0]:
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return dict(hit[1])
+
+    def _update_cache(self, key: bytes, recommendation: Dict[str, Any]):
+        """Store a recommendation, evicting the least recently used beyond cache_size."""
+        if self.cache_ttl <= 0:
+            return
+        self._cache[key] = (time.monotonic() + self.cache_ttl, dict(recommendation))
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    @classmethod
+    def _shared_http(cls, endpoint_url: str) -> requests.Session:
+        """Return the process-wide session for endpoint_url, creating it on first use."""
+        session = cls._http_sessions.get(endpoint_url)
+        if session is None:
+            # Retries stay in with_backoff_sync rather than on the adapter
+            session = cls._http_sessions[endpoint_url] = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=16)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        return session
+
+    async def _ensure_session(self) -> aiohttp.ClientSession:
+        """Return the event loop's shared HTTP session, creating it on first use."""
+        return shared_session()
+
+    async def close(self):
+        """Close the pooled HTTP sessions (shared ones are reopened on next use)."""
+        await close_shared_session()
+        self._http.close()
+
+    def _build_payload(self, context: Dict[str, Any], model: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Build the request body for the configured endpoint, for model
+        (self.model by default).
 
         Supports two payload modes:
-        - Decision endpoint (default from .env.example): POST {"context": "<json-string>"}
+        - Decision endpoint (default from .env.example): POST {"context": "<json-string>"},
+          or {"context": {...}} with LLM_STRUCTURED_CONTEXT=true
         - OpenAI-style completions (fallback): POST {"model","prompt","max_tokens","temperature"}
         """
-        import requests
+        # If endpoint looks like the documented decision endpoint, send structured JSON context
+        if self._is_decision_endpoint():
+            return self._wrap_decision_context(self._build_context_payload(context, model))
 
-        headers = {"Content-Type": "application/json"}
+        # Fallback to prompt-based contract
+        return {
+            "model": model or self.model,
+            "prompt": self._build_context_prompt(context),
+            "max_tokens": 1000,
+            "temperature": 0.7
+        }
 
-        # If endpoint looks like the documented decision endpoint, send structured JSON context
-        if self.endpoint_url.rstrip("/").endswith("/decision"):
-            payload_context = self._build_context_payload(context)
-            payload = {
-                "context": json.dumps(payload_context)
-            }
-        else:
-            # Fallback to prompt-based contract
-            payload = {
+    def _build_batch_payload(self, contexts: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Request body covering several symbols: a "symbols" list for the decision
+        endpoint, or one prompt with a labeled section per symbol asking for a
+        JSON array.
+        """
+        if self._is_decision_endpoint():
+            return self._wrap_decision_context({
+                **self._prompt_fields(),
                 "model": self.model,
-                "prompt": self._build_context_prompt(context),
-                "max_tokens": 1000,
-                "temperature": 0.7
-            }
+                "symbols": [self._context_fields(context) for context in contexts],
+            })
+
+        sections = [
+            f"[[SYMBOL_{i}]] {context.get('symbol', 'UNKNOWN')}\n\n=== PRICE DATA ===\n{self._market_data_text(context)}"
+            for i, context in enumerate(contexts, 1)
+        ]
+        prompt = (
+            f"{self.system_prompt}\n\n"
+            f"Analyze the following {len(contexts)} symbols and respond with only a JSON array holding one "
+            'object per symbol, in the order given: {"symbol", "action": "BUY"|"SELL"|"HOLD", '
+            '"confidence": 0-100, "reason"}\n\n'
+            + "\n\n".join(sections)
+        )
+        return {
+            "model": self.model,
+            "prompt": prompt,
+            "max_tokens": 1000 * len(contexts),
+            "temperature": 0.7
+        }
+
+    def _is_decision_endpoint(self) -> bool:
+        return self.endpoint_url.rstrip("/").endswith("/decision")
+
+    def _wrap_decision_context(self, payload_context: Dict[str, Any]) -> Dict[str, Any]:
+        if self.structured_context:
+            # Nested object: the whole body is serialized exactly once
+            return {"context": payload_context}
+        return {
+            "context": dumps(payload_context)
+        }
+
+    def _query_llm(self, context: Dict[str, Any]) -> Any:
+        """
+        Query endpoint with the market context.
+        """
+        headers = {"Content-Type": "application/json"}
+
+        def post():
+            body = dumps(self._build_payload(context)).encode()
+            self._rpm_limiter.acquire_sync()
+            self._tpm_limiter.acquire_sync(len(body) // 4)
+            response = self._http.post(self.endpoint_url, data=body, headers=headers, timeout=60)
+            response.raise_for_status()
+            return loads(response.content)
+
+        sent_hash = self._prompt_registered
+        response = with_backoff_sync(post)
+        if self._check_prompt_miss(response) and sent_hash:
+            response = with_backoff_sync(post)
+        return response
+
+    async def _aquery_llm(self, context: Dict[str, Any], model: Optional[str] = None) -> Any:
+        """
+        POST the context's payload to the endpoint on the shared aiohttp session.
+        """
+        return await self._apost(lambda: self._build_payload(context, model))
+
+    async def _apost(self, build_payload: Callable[[], Dict[str, Any]], stop_at_json: bool = False) -> Any:
+        """
+        POST build_payload() with backoff, rebuilding it if the endpoint
+        has forgotten our prompt hash.
 
-        response = requests.post(self.endpoint_url, json=payload, headers=headers, timeout=60)
-        response.raise_for_status()
-        return response.json()
+        With streaming enabled, completions replies are read as they are
+        generated; stop_at_json ends the stream as soon as the first complete
+        JSON object/array has arrived, skipping any trailing commentary.
+        """
+        session = await self._ensure_session()
+        headers = {"Content-Type": "application/json"}
+        stream = self.stream and not self._is_decision_endpoint()
+
+        async def post():
+            payload = build_payload()
+            body = dumps(payload).encode()
+            await self._rpm_limiter.acquire()
+            await self._tpm_limiter.acquire(len(body) // 4)
+            if stream:
+                text = await self._stream_text(session, {**payload, "stream": True}, stop_at_json)
+                return {"choices": [{"text": text}]}
+            async with session.post(self.endpoint_url, data=body, headers=headers,
+                                    timeout=self._timeout) as response:
+                response.raise_for_status()
+                return loads(await response.read())
+
+        sent_hash = self._prompt_registered
+        response = await with_backoff(post)
+        if self._check_prompt_miss(response) and sent_hash:
+            response = await with_backoff(post)
+        return response
+
+    async def _stream_text(self, session: aiohttp.ClientSession, payload: Dict[str, Any],
+                           stop_at_json: bool) -> str:
+        """Join the streamed completion text, or return its first JSON block early."""
+        scanner = _JsonBlockScanner() if stop_at_json else None
+        parts: List[str] = []
+        async with contextlib.aclosing(post_sse(session, self.endpoint_url, payload, timeout=60)) as events:
+            async for event in events:
+                choice = (event.get("choices") or [{}])[0]
+                # "text" for completions, "delta" for chat chunks, "message" if streaming was ignored
+                piece = choice.get("text") or (choice.get("delta") or choice.get("message") or {}).get("content") or ""
+                if scanner is not None:
+                    block = scanner.feed(piece)
+                    if block is not None:
+                        return block
+                parts.append(piece)
+        return "".join(parts)
+
+    def _check_prompt_miss(self, response: Any) -> bool:
+        """
+        Track whether the endpoint knows our prompt hash.
 
-    def _build_context_payload(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        Returns True when it reported the hash as unknown, in which case the
+        next payload carries the full prompt again.
+        """
+        if isinstance(response, dict) and response.get("error") == "unknown_prompt":
+            self._prompt_registered = False
+            return True
+        if self.prompt_hash_enabled:
+            self._prompt_registered = True
+        return False
+
+    def _build_context_payload(self, context: Dict[str, Any], model: Optional[str] = None) -> Dict[str, Any]:
         """
         Build structured JSON payload for the decision endpoint.
         """
+        return {
+            **self._prompt_fields(),
+            "model": model or self.model,
+            **self._context_fields(context),
+        }
+
+    def _prompt_fields(self) -> Dict[str, str]:
+        """System prompt (or its hash once registered) for decision payloads."""
+        prompt = {} if self._prompt_registered else {"system_prompt": self.system_prompt}
+        if self.prompt_hash_enabled:
+            prompt["system_prompt_hash"] = self._prompt_hash
+        return prompt
+
+    def _context_fields(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        """Per-symbol market data for decision payloads."""
         symbol = context.get('symbol', 'UNKNOWN')
         return {
-            "system_prompt": self.system_prompt,
-            "model": self.model,
             "symbol": symbol,
             "price_data": context.get('price_data', {}),
             "sentiment_data": context.get('sentiment_data', {}),
@@ -94,37 +680,31 @@ Provide:
 
     def _build_context_prompt(self, context: Dict[str, Any]) -> str:
         """Build prompt context for the trading recommendation."""
-        symbol = context.get('symbol', 'UNKNOWN')
-
-        prompt_parts = [
-            self.system_prompt,
-            "",
-            f"Please analyze the following market data for {symbol} and provide a trading recommendation:",
-            "",
-            "=== PRICE DATA ===",
-        ]
-
-        # Add price information
-        if 'price_data' in context and isinstance(context['price_data'], dict):
-            price_data = context['price_data']
-            sources = price_data.get('sources') or []
-            prompt_parts.extend([
-                f"Current Price: ${price_data.get('current_price', 'N/A')}",
-                f"Price Sources: {', '.join(sources) if sources else 'N/A'}",
-                f"Price Verification: {'Verified' if price_data.get('verified', False) else 'Unverified'}",
-            ])
-
-        # Add sentiment information
-        prompt_parts.append("\n=== SENTIMENT ANALYSIS ===")
-        if 'sentiment_data' in context and isinstance(context['sentiment_data'], dict):
-            sentiment = context['sentiment_data']
-            sources = sentiment.get('sources') or []
-            prompt_parts.extend([
-                f"Sentiment Score: {sentiment.get('score', 'N/A')}",
-                f"Sentiment Sources: {', '.join(sources) if sources else 'N/A'}",
-            ])
-
-        return "\n".join(prompt_parts)
+        return self._prompt_template.format(symbol=context.get('symbol', 'UNKNOWN'),
+                                            market_data=self._market_data_text(context))
+
+    def _market_data_text(self, context: Dict[str, Any]) -> str:
+        """Price and sentiment sections of the completions prompt."""
+        price_text = sentiment_text = ""
+
+        price_data = context.get('price_data')
+        if isinstance(price_data, dict):
+            sources = price_data.get('sources')
+            price_text = _PRICE_TEMPLATE.format(
+                current_price=price_data.get('current_price', 'N/A'),
+                sources=', '.join(sources) if sources else 'N/A',
+                verification='Verified' if price_data.get('verified', False) else 'Unverified',
+            )
+
+        sentiment = context.get('sentiment_data')
+        if isinstance(sentiment, dict):
+            sources = sentiment.get('sources')
+            sentiment_text = _SENTIMENT_TEMPLATE.format(
+                score=sentiment.get('score', 'N/A'),
+                sources=', '.join(sources) if sources else 'N/A',
+            )
+
+        return f"{price_text}{_SENTIMENT_HEADER}{sentiment_text}"
 
     def _parse_llm_response(self, response: Any, context: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -152,88 +732,29 @@ Provide:
                 if not chosen:
                     chosen = next((d for d in response["decisions"] if isinstance(d, dict)), {})
 
-                action = str(chosen.get("action", "HOLD")).upper()
-                confidence = float(chosen.get("confidence", 0.0))
-                reason = chosen.get("reason") or chosen.get("explanation") or "No reason provided."
-
-                return {
-                    "symbol": symbol or chosen.get("symbol", "UNKNOWN"),
-                    "action": action if action in ("BUY", "SELL", "HOLD") else "HOLD",
-                    "confidence": max(0.0, min(100.0, confidence)),
-                    "reason": reason,
-                }
+                return _fields_recommendation(chosen, symbol or chosen.get("symbol", "UNKNOWN"))
 
             # 2) OpenAI-style completions: {"choices":[{"text": "..."}]}
             if isinstance(response, dict) and isinstance(response.get("choices"), list) and response["choices"]:
                 choice = response["choices"][0] or {}
                 text = choice.get("text") or (choice.get("message") or {}).get("content") or ""
-                action = "HOLD"
-                lt = text.lower()
-                if "buy" in lt and "sell" not in lt:
-                    action = "BUY"
-                elif "sell" in lt and "buy" not in lt:
-                    action = "SELL"
-                confidence = 0.0
-                # naive extraction of confidence like "Confidence: 78%"
-                for token in text.replace("%", " ").split():
-                    try:
-                        val = float(token)
-                        if 0.0 <= val <= 100.0:
-                            confidence = val
-                            break
-                    except Exception:
-                        pass
-                reason = text.strip() or "No reasoning provided."
-
-                return {
-                    "symbol": symbol,
-                    "action": action,
-                    "confidence": confidence,
-                    "reason": reason,
-                }
+                return (_json_recommendation(text, symbol)
+                        or _text_recommendation(text, symbol, text.strip() or "No reasoning provided."))
 
             # 3) Flat dict with keys
             if isinstance(response, dict) and ("action" in response or "recommendation" in response):
-                action = str(response.get("action") or response.get("recommendation") or "HOLD").upper()
-                confidence = float(response.get("confidence", 0.0))
-                reason = response.get("reason") or response.get("explanation") or "No reason provided."
-                sym = response.get("symbol") or symbol
-                return {
-                    "symbol": sym,
-                    "action": action if action in ("BUY", "SELL", "HOLD") else "HOLD",
-                    "confidence": max(0.0, min(100.0, confidence)),
-                    "reason": reason,
-                }
+                return _fields_recommendation(response, response.get("symbol") or symbol)
 
             # 4) String response: attempt to parse keywords
             if isinstance(response, str):
                 text = response
+                recommendation = _json_recommendation(text, symbol)
+                if recommendation is not None:
+                    return recommendation
             else:
                 text = json.dumps(response)
 
-            lt = text.lower()
-            action = "HOLD"
-            if "buy" in lt and "sell" not in lt:
-                action = "BUY"
-            elif "sell" in lt and "buy" not in lt:
-                action = "SELL"
-
-            confidence = 0.0
-            for token in text.replace("%", " ").split():
-                try:
-                    val = float(token)
-                    if 0.0 <= val <= 100.0:
-                        confidence = val
-                        break
-                except Exception:
-                    pass
-
-            return {
-                "symbol": symbol,
-                "action": action,
-                "confidence": confidence,
-                "reason": text if text else "No reasoning provided.",
-            }
+            return _text_recommendation(text, symbol, text if text else "No reasoning provided.")
 
         except Exception as e:
             logger.error(f"Failed to parse LLM response: {e}")
@@ -243,10 +764,4 @@ Provide:
         """
         Safe fallback recommendation when the LLM endpoint is not available or parsing fails.
         """
-        symbol = context.get('symbol', 'UNKNOWN')
-        return {
-            "symbol": symbol,
-            "action": "HOLD",
-            "confidence": 0.0,
-            "reason": "LLM endpoint not configured or response could not be parsed."
-        }
+        return {**_MOCK_RECOMMENDATION, "symbol": context.get('symbol', 'UNKNOWN')}
@@ -1,16 +1,25 @@
 """
 Coinbase portfolio management module.
 """
+import asyncio
 import os
 import time
 import hmac
 import hashlib
 import base64
-import json
+import binascii
 from typing import Dict, List, Optional, Tuple
+import aiohttp
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from loguru import logger
-from decimal import Decimal
+
+from common.fastjson import dumps, dumps_pretty, loads
+
+# Below this many currencies the NumPy setup costs more than the plain loop
+_NUMPY_MIN_CURRENCIES = 8
 
 
 class CoinbasePortfolioManager:
@@ -24,6 +33,7 @@ class CoinbasePortfolioManager:
         self.api_secret = api_secret or os.getenv('COINBASE_API_SECRET')
         self.passphrase = passphrase or os.getenv('COINBASE_PASSPHRASE')
         self.sandbox = sandbox or os.getenv('COINBASE_SANDBOX', 'true').lower() == 'true'
+        self._has_credentials = bool(self.api_key and self.api_secret and self.passphrase)
         
         # Set API URLs
         if self.sandbox:
@@ -31,27 +41,44 @@ class CoinbasePortfolioManager:
         else:
             self.api_url = 'https://api.exchange.coinbase.com'
         
+        # Pooled keep-alive session. Retry only covers idempotent methods
+        # (urllib3's default excludes POST), so orders are never resubmitted.
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(
+            pool_connections=8, pool_maxsize=16,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+        ))
+        
+        self._async_session: Optional[aiohttp.ClientSession] = None
+        
+        # HMAC keyed with the decoded secret, copied per request to sign
+        self._hmac: Optional[hmac.HMAC] = None
+        if self.api_secret:
+            try:
+                self._hmac = hmac.new(base64.b64decode(self.api_secret), digestmod=hashlib.sha256)
+            except (binascii.Error, ValueError) as e:
+                logger.error(f"Invalid Coinbase API secret (expected base64): {e}")
+        
         # Portfolio cache
         self.portfolio_cache = {}
         self.cache_duration = 60  # 1 minute cache
-        self.last_cache_time = 0
+        self._cache_deadline_ns = 0  # time.monotonic_ns() until which portfolio_cache is valid
     
     def _generate_signature(self, timestamp: str, method: str, 
                           request_path: str, body: str = '') -> str:
         """Generate signature for Coinbase Pro API authentication."""
-        if not self.api_secret:
+        if self._hmac is None:
             raise ValueError("API secret not provided")
         
-        message = timestamp + method + request_path + body
-        hmac_key = base64.b64decode(self.api_secret)
-        signature = hmac.new(hmac_key, message.encode(), hashlib.sha256)
+        signature = self._hmac.copy()
+        signature.update(f"{timestamp}{method}{request_path}{body}".encode())
         signature_b64 = base64.b64encode(signature.digest()).decode()
         
         return signature_b64
     
     def _get_headers(self, method: str, request_path: str, body: str = '') -> Dict[str, str]:
         """Get headers for API request."""
-        if not all([self.api_key, self.api_secret, self.passphrase]):
+        if not self._has_credentials:
             logger.warning("Coinbase API credentials not provided, using mock mode")
             return {}
         
@@ -79,21 +106,21 @@ class CoinbasePortfolioManager:
             return self.portfolio_cache
         
         try:
-            if not all([self.api_key, self.api_secret, self.passphrase]):
+            if not self._has_credentials:
                 logger.warning("Using mock portfolio data")
                 return self._get_mock_portfolio()
             
             request_path = '/accounts'
             headers = self._get_headers('GET', request_path)
             
-            response = requests.get(
+            response = self.session.get(
                 f"{self.api_url}{request_path}",
                 headers=headers,
                 timeout=10
             )
             
             if response.status_code == 200:
-                accounts = response.json()
+                accounts = loads(response.content)
                 portfolio = {}
                 
                 for account in accounts:
@@ -126,9 +153,15 @@ class CoinbasePortfolioManager:
         Returns:
             Dict with position information
         """
-        portfolio = self.get_portfolio_balance()
+        # Per-symbol lookups inside the cache window skip get_portfolio_balance
+        # (and its log line) entirely
+        if self._is_cache_valid():
+            portfolio = self.portfolio_cache
+        else:
+            portfolio = self.get_portfolio_balance()
         
-        if symbol not in portfolio:
+        position = portfolio.get(symbol)
+        if position is None:
             return {
                 'quantity': 0.0,
                 'value_usd': 0.0,
@@ -136,9 +169,9 @@ class CoinbasePortfolioManager:
                 'hold': 0.0
             }
         
-        quantity = portfolio[symbol]['balance']
-        available = portfolio[symbol]['available']
-        hold = portfolio[symbol]['hold']
+        quantity = position['balance']
+        available = position['available']
+        hold = position['hold']
         
         current_price = current_prices.get(symbol, 0.0)
         value_usd = quantity * current_price
@@ -162,6 +195,9 @@ class CoinbasePortfolioManager:
             Dict with portfolio valuation information
         """
         portfolio = self.get_portfolio_balance()
+        if len(portfolio) >= _NUMPY_MIN_CURRENCIES:
+            return self._calculate_portfolio_value_vectorized(portfolio, current_prices)
+        
         total_value = 0.0
         crypto_value = 0.0
         usd_balance = 0.0
@@ -199,6 +235,40 @@ class CoinbasePortfolioManager:
             'positions': positions
         }
     
+    def _calculate_portfolio_value_vectorized(self, portfolio: Dict[str, Dict[str, float]],
+                                              current_prices: Dict[str, float]) -> Dict[str, float]:
+        """calculate_portfolio_value for large portfolios: aligned quantity and price vectors."""
+        currencies = list(portfolio)
+        n = len(currencies)
+        qty = np.fromiter((portfolio[c]['balance'] for c in currencies), dtype=np.float64, count=n)
+        price = np.fromiter(
+            (1.0 if c == 'USD' else current_prices.get(c, 0.0) for c in currencies),
+            dtype=np.float64, count=n
+        )
+        is_usd = np.fromiter((c == 'USD' for c in currencies), dtype=bool, count=n)
+        
+        values = qty * price
+        total_value = float(values.sum())
+        usd_balance = float(qty[is_usd][-1]) if is_usd.any() else 0.0
+        crypto_value = float(values[~is_usd].sum())
+        scale = 100.0 / total_value if total_value > 0 else 0.0
+        
+        positions = {
+            currencies[i]: {
+                'quantity': float(qty[i]),
+                'value_usd': float(values[i]),
+                'percentage': float(values[i]) * scale
+            }
+            for i in np.flatnonzero((qty > 0) & ~is_usd)
+        }
+        
+        return {
+            'total_value_usd': total_value,
+            'crypto_value_usd': crypto_value,
+            'usd_balance': usd_balance,
+            'positions': positions
+        }
+    
     def place_market_order(self, symbol: str, side: str, size: float) -> Dict:
         """
         Place a market order.
@@ -212,29 +282,24 @@ class CoinbasePortfolioManager:
             Order response
         """
         try:
-            if not all([self.api_key, self.api_secret, self.passphrase]):
+            if not self._has_credentials:
                 logger.warning("Using mock order placement")
                 return self._mock_order_response(symbol, side, size)
             
             request_path = '/orders'
-            body = json.dumps({
-                'type': 'market',
-                'side': side,
-                'product_id': symbol,
-                'size': str(size)
-            })
+            body = self._order_body(symbol, side, size)
             
             headers = self._get_headers('POST', request_path, body)
             
-            response = requests.post(
+            response = self.session.post(
                 f"{self.api_url}{request_path}",
                 headers=headers,
-                data=body,
+                data=body.encode(),
                 timeout=10
             )
             
             if response.status_code == 200:
-                order_data = response.json()
+                order_data = loads(response.content)
                 logger.info(f"Placed {side} order for {size} {symbol}: {order_data['id']}")
                 return order_data
             else:
@@ -245,23 +310,87 @@ class CoinbasePortfolioManager:
             logger.error(f"Error placing order: {e}")
             return self._mock_order_response(symbol, side, size, success=False)
     
+    async def place_market_orders(self, orders: List[Tuple[str, str, float]]) -> List[Dict]:
+        """
+        Place several market orders concurrently.
+        
+        Args:
+            orders: (symbol, side, size) tuples, as for place_market_order
+            
+        Returns:
+            One order response per order, in the same order
+        """
+        if not self._has_credentials:
+            logger.warning("Using mock order placement")
+            return [self._mock_order_response(*order) for order in orders]
+        
+        # Sign everything up front; only the HTTP round trips overlap
+        request_path = '/orders'
+        prepared = []
+        for symbol, side, size in orders:
+            body = self._order_body(symbol, side, size)
+            prepared.append((body, self._get_headers('POST', request_path, body)))
+        
+        session = await self._ensure_async_session()
+        url = f"{self.api_url}{request_path}"
+        
+        async def place(order: Tuple[str, str, float], body: str, headers: Dict[str, str]) -> Dict:
+            symbol, side, size = order
+            try:
+                async with session.post(url, data=body.encode(), headers=headers) as response:
+                    if response.status == 200:
+                        order_data = loads(await response.read())
+                        logger.info(f"Placed {side} order for {size} {symbol}: {order_data['id']}")
+                        return order_data
+                    logger.error(f"Failed to place order: {response.status} - {await response.text()}")
+                    return self._mock_order_response(symbol, side, size, success=False)
+            except Exception as e:
+                logger.error(f"Error placing order: {e}")
+                return self._mock_order_response(symbol, side, size, success=False)
+        
+        return list(await asyncio.gather(*(
+            place(order, body, headers) for order, (body, headers) in zip(orders, prepared)
+        )))
+    
+    async def _ensure_async_session(self) -> aiohttp.ClientSession:
+        """Return the aiohttp session for concurrent orders, creating it on first use."""
+        if self._async_session is None or self._async_session.closed:
+            self._async_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+        return self._async_session
+    
+    async def close(self):
+        """Close the pooled HTTP sessions."""
+        if self._async_session is not None and not self._async_session.closed:
+            await self._async_session.close()
+        self._async_session = None
+        self.session.close()
+    
+    def _order_body(self, symbol: str, side: str, size: float) -> str:
+        """JSON body for a market order."""
+        return dumps({
+            'type': 'market',
+            'side': side,
+            'product_id': symbol,
+            'size': str(size)
+        })
+    
     def get_order_status(self, order_id: str) -> Dict:
         """Get status of a specific order."""
         try:
-            if not all([self.api_key, self.api_secret, self.passphrase]):
+            if not self._has_credentials:
                 return {'status': 'filled', 'id': order_id}
             
             request_path = f'/orders/{order_id}'
             headers = self._get_headers('GET', request_path)
             
-            response = requests.get(
+            response = self.session.get(
                 f"{self.api_url}{request_path}",
                 headers=headers,
                 timeout=10
             )
             
             if response.status_code == 200:
-                return response.json()
+                return loads(response.content)
             else:
                 logger.error(f"Failed to get order status: {response.status_code}")
                 return {'status': 'unknown', 'id': order_id}
@@ -297,12 +426,12 @@ class CoinbasePortfolioManager:
     
     def _is_cache_valid(self) -> bool:
         """Check if portfolio cache is still valid."""
-        return time.time() - self.last_cache_time < self.cache_duration
+        return time.monotonic_ns() < self._cache_deadline_ns
     
     def _update_cache(self, portfolio: Dict):
         """Update portfolio cache."""
         self.portfolio_cache = portfolio
-        self.last_cache_time = time.time()
+        self._cache_deadline_ns = time.monotonic_ns() + int(self.cache_duration * 1_000_000_000)
 
 
 if __name__ == "__main__":
@@ -311,9 +440,9 @@ if __name__ == "__main__":
     
     # Test portfolio balance
     portfolio = manager.get_portfolio_balance()
-    print("Portfolio balance:", json.dumps(portfolio, indent=2))
+    print("Portfolio balance:", dumps_pretty(portfolio))
     
     # Test portfolio value calculation
     mock_prices = {'BTC': 45000, 'ETH': 3000}
     portfolio_value = manager.calculate_portfolio_value(mock_prices)
-    print("Portfolio value:", json.dumps(portfolio_value, indent=2))
\ No newline at end of file
+    print("Portfolio value:", dumps_pretty(portfolio_value))
\ No newline at end of file
@@ -2,15 +2,57 @@
 Risk management and position sizing module.
 """
 import numpy as np
-import math
+from functools import lru_cache
 from typing import Dict, List, Optional, Tuple
 from loguru import logger
-import json
+
+from common.fastjson import dumps_pretty
+
+# Below this many positions plain Python beats NumPy's per-call overhead
+_NUMPY_MIN_POSITIONS = 8
+
+# Position sizing returned for invalid inputs; copied so callers may mutate it
+_ZERO_POSITION = {
+    'position_size': 0,
+    'position_value_usd': 0,
+    'portfolio_percentage': 0,
+    'max_loss_usd': 0,
+    'max_loss_percentage': 0,
+    'risk_per_share': 0,
+    'entry_price': 0,
+    'stop_loss_price': 0,
+    'confidence_adjusted': 0,
+    'method_used': 'none'
+}
+
+
+@lru_cache(maxsize=64)
+def _risk_recommendations(over_exposed: bool, over_limit: bool, concentrated: bool,
+                          max_position_size: float) -> Tuple[str, ...]:
+    """Recommendation messages for each combination of breached limits."""
+    recommendations = []
+    
+    if over_exposed:
+        recommendations.append("Consider reducing overall crypto exposure")
+    
+    if over_limit:
+        recommendations.append(f"Largest position exceeds {max_position_size*100}% limit")
+    
+    if concentrated:
+        recommendations.append("Portfolio is highly concentrated - consider diversification")
+    
+    if len(recommendations) == 0:
+        recommendations.append("Portfolio risk levels are within acceptable limits")
+    
+    return tuple(recommendations)
 
 
 class RiskManager:
     """Calculates position sizes and manages trading risk."""
     
+    __slots__ = ('max_position_size', 'risk_per_trade', 'max_drawdown',
+                 'trade_history', 'current_drawdown')
+    
     def __init__(self, max_position_size: float = 0.1, 
                  risk_per_trade: float = 0.02,
                  max_drawdown: float = 0.15):
@@ -73,10 +115,11 @@ class RiskManager:
         position_size = min(position_size, max_shares)
         
         # Calculate position metrics
+        percent_of_portfolio = 100.0 / portfolio_value
         position_value = position_size * entry_price
-        portfolio_percentage = (position_value / portfolio_value) * 100
+        portfolio_percentage = position_value * percent_of_portfolio
         max_loss = position_size * risk_per_share
-        max_loss_percentage = (max_loss / portfolio_value) * 100
+        max_loss_percentage = max_loss * percent_of_portfolio
         
         return {
             'position_size': position_size,
@@ -91,6 +134,86 @@ class RiskManager:
             'method_used': method
         }
     
+    def calculate_position_sizes_batch(self,
+                                       portfolio_value: float,
+                                       entry_prices: np.ndarray,
+                                       stop_loss_prices: np.ndarray,
+                                       confidences: np.ndarray,
+                                       method: str = "fixed_risk") -> Dict[str, np.ndarray]:
+        """
+        Vectorized calculate_position_size over aligned per-symbol arrays.
+        
+        Args:
+            portfolio_value: Total portfolio value in USD
+            entry_prices: Planned entry prices
+            stop_loss_prices: Stop loss prices
+            confidences: Confidence levels (0.0 to 1.0)
+            method: Position sizing method ('fixed_risk', 'kelly', 'volatility')
+            
+        Returns:
+            The calculate_position_size fields as arrays, one element per
+            symbol; rows with an invalid price (or every row, when
+            portfolio_value <= 0) are zeroed with method 'none'.
+            A zero stop distance sizes a Kelly position by the cap alone
+            instead of raising ZeroDivisionError.
+        """
+        entry_prices = np.asarray(entry_prices, dtype=np.float64)
+        stop_loss_prices = np.asarray(stop_loss_prices, dtype=np.float64)
+        confidences = np.broadcast_to(np.asarray(confidences, dtype=np.float64), entry_prices.shape)
+        
+        valid = (entry_prices > 0) & (stop_loss_prices > 0)
+        if not valid.all():
+            logger.error("Invalid entry or stop loss price")
+        if portfolio_value <= 0:
+            # An empty account gets no positions (and no NaN percentages)
+            logger.error(f"Invalid portfolio value: {portfolio_value}")
+            valid[:] = False
+        if method not in ("fixed_risk", "kelly", "volatility"):
+            logger.error(f"Unknown position sizing method: {method}")
+            valid[:] = False
+        safe_entry = np.where(valid, entry_prices, 1.0)
+        
+        risk_per_share = np.abs(entry_prices - stop_loss_prices)
+        risk_percentage = risk_per_share / safe_entry
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if method == "fixed_risk":
+                risk_amount = portfolio_value * self.risk_per_trade * confidences
+                position_sizes = np.where(risk_per_share > 0, risk_amount / risk_per_share, 0.0)
+            elif method == "kelly":
+                # Same simplified Kelly as _calculate_kelly_size, 2:1 reward to risk
+                p = np.clip(confidences, 0.1, 0.9)
+                kelly_fraction = np.clip((2.0 * p - (1 - p)) / 2.0, 0, self.max_position_size)
+                final_fraction = np.minimum(kelly_fraction, self.risk_per_trade / risk_percentage)
+                position_sizes = portfolio_value * final_fraction / safe_entry
+            elif method == "volatility":
+                adjusted_factor = 0.05 / np.maximum(risk_percentage, 0.01) * confidences
+                position_sizes = portfolio_value * self.risk_per_trade * adjusted_factor / safe_entry
+            else:
+                position_sizes = np.zeros_like(entry_prices)
+        
+        # Apply maximum position size constraint
+        max_shares = portfolio_value * self.max_position_size / safe_entry
+        position_sizes = np.where(valid, np.minimum(position_sizes, max_shares), 0.0)
+        
+        # Calculate position metrics
+        percent_of_portfolio = 100.0 / portfolio_value if portfolio_value > 0 else 0.0
+        position_values = position_sizes * entry_prices
+        max_losses = position_sizes * risk_per_share
+        
+        return {
+            'position_size': position_sizes,
+            'position_value_usd': position_values,
+            'portfolio_percentage': position_values * percent_of_portfolio,
+            'max_loss_usd': max_losses,
+            'max_loss_percentage': max_losses * percent_of_portfolio,
+            'risk_per_share': np.where(valid, risk_per_share, 0.0),
+            'entry_price': np.where(valid, entry_prices, 0.0),
+            'stop_loss_price': np.where(valid, stop_loss_prices, 0.0),
+            'confidence_adjusted': np.where(valid, confidences, 0.0),
+            'method_used': np.where(valid, method, 'none')
+        }
+    
     def _calculate_fixed_risk_size(self, portfolio_value: float, 
                                  risk_per_share: float, 
                                  confidence: float) -> float:
@@ -185,16 +308,45 @@ class RiskManager:
             stop_distance = entry_price * stop_percentage
             profit_distance = entry_price * profit_percentage
         
-        if side.lower() == 'buy':
-            stop_loss = entry_price - stop_distance
-            take_profit = entry_price + profit_distance
-        else:  # sell
-            stop_loss = entry_price + stop_distance
-            take_profit = entry_price - profit_distance
+        # Stops sit below entry for buys and above it for sells
+        sign = 1.0 if side.lower() == 'buy' else -1.0
         
         return {
-            'stop_loss': stop_loss,
-            'take_profit': take_profit,
+            'stop_loss': entry_price - sign * stop_distance,
+            'take_profit': entry_price + sign * profit_distance,
+            'stop_distance': stop_distance,
+            'profit_distance': profit_distance,
+            'risk_reward_ratio': profit_distance / stop_distance
+        }
+    
+    def calculate_stop_loss_take_profit_batch(self, entry_prices: np.ndarray,
+                                              sides: np.ndarray,
+                                              atr: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+        """
+        Vectorized calculate_stop_loss_take_profit over per-symbol arrays.
+        
+        Args:
+            entry_prices: Entry prices for the positions
+            sides: 1 for buy, -1 for sell (a scalar applies to every symbol)
+            atr: Average True Range per symbol (optional; non-positive entries
+                 fall back to the default percentages)
+            
+        Returns:
+            The calculate_stop_loss_take_profit fields as arrays
+        """
+        entry_prices = np.asarray(entry_prices, dtype=np.float64)
+        sign = np.asarray(sides, dtype=np.float64)
+        
+        stop_distance = entry_prices * 0.05  # 5% stop loss
+        profit_distance = entry_prices * 0.10  # 10% take profit
+        if atr is not None:
+            atr = np.asarray(atr, dtype=np.float64)
+            stop_distance = np.where(atr > 0, atr * 2, stop_distance)  # 2 ATR stop loss
+            profit_distance = np.where(atr > 0, atr * 4, profit_distance)  # 4 ATR take profit
+        
+        return {
+            'stop_loss': entry_prices - sign * stop_distance,
+            'take_profit': entry_prices + sign * profit_distance,
             'stop_distance': stop_distance,
             'profit_distance': profit_distance,
             'risk_reward_ratio': profit_distance / stop_distance
@@ -212,36 +364,32 @@ class RiskManager:
         Returns:
             Portfolio risk assessment
         """
-        total_exposure = 0
-        crypto_exposure = 0
-        max_single_position = 0
-        
-        position_sizes = []
-        
-        for symbol, position in positions.items():
-            if symbol == 'USD':
-                continue
-            
-            percentage = position.get('percentage', 0)
-            position_sizes.append(percentage)
-            
-            crypto_exposure += percentage
-            max_single_position = max(max_single_position, percentage)
-        
-        total_exposure = crypto_exposure
-        
-        # Calculate concentration risk
-        if len(position_sizes) > 0:
+        if len(positions) >= _NUMPY_MIN_POSITIONS:
+            sizes = np.fromiter(
+                (position.get('percentage', 0) for symbol, position in positions.items() if symbol != 'USD'),
+                dtype=np.float64
+            )
+            position_count = sizes.size
+            crypto_exposure = float(sizes.sum())
+            max_single_position = float(sizes.max(initial=0))
             # Herfindahl Index for concentration
-            concentration_index = sum(p**2 for p in position_sizes) / 100
+            concentration_index = float(np.dot(sizes, sizes)) / 100
         else:
-            concentration_index = 0
+            position_sizes = [
+                position.get('percentage', 0)
+                for symbol, position in positions.items() if symbol != 'USD'
+            ]
+            position_count = len(position_sizes)
+            crypto_exposure = sum(position_sizes)
+            max_single_position = max([0, *position_sizes])
+            # Herfindahl Index for concentration
+            concentration_index = sum([p * p for p in position_sizes]) / 100
         
         # Simple correlation adjustment (if correlations provided)
-        if correlations and len(position_sizes) > 1:
+        if correlations and position_count > 1:
             # This is a simplified correlation adjustment
             avg_correlation = 0.7  # Assume high correlation in crypto markets
-            correlation_adjustment = 1 + (avg_correlation * (len(position_sizes) - 1) / len(position_sizes))
+            correlation_adjustment = 1 + (avg_correlation * (position_count - 1) / position_count)
             adjusted_risk = crypto_exposure * correlation_adjustment
         else:
             adjusted_risk = crypto_exposure
@@ -271,36 +419,16 @@ class RiskManager:
                                 max_position: float,
                                 concentration: float) -> List[str]:
         """Generate risk management recommendations."""
-        recommendations = []
-        
-        if crypto_exposure > 80:
-            recommendations.append("Consider reducing overall crypto exposure")
-        
-        if max_position > self.max_position_size * 100:
-            recommendations.append(f"Largest position exceeds {self.max_position_size*100}% limit")
-        
-        if concentration > 0.3:
-            recommendations.append("Portfolio is highly concentrated - consider diversification")
-        
-        if len(recommendations) == 0:
-            recommendations.append("Portfolio risk levels are within acceptable limits")
-        
-        return recommendations
+        return list(_risk_recommendations(
+            crypto_exposure > 80,
+            max_position > self.max_position_size * 100,
+            concentration > 0.3,
+            self.max_position_size
+        ))
     
     def _get_zero_position(self) -> Dict[str, float]:
         """Return zero position sizing."""
-        return {
-            'position_size': 0,
-            'position_value_usd': 0,
-            'portfolio_percentage': 0,
-            'max_loss_usd': 0,
-            'max_loss_percentage': 0,
-            'risk_per_share': 0,
-            'entry_price': 0,
-            'stop_loss_price': 0,
-            'confidence_adjusted': 0,
-            'method_used': 'none'
-        }
+        return _ZERO_POSITION.copy()
 
 
 if __name__ == "__main__":
@@ -316,11 +444,11 @@ if __name__ == "__main__":
     position_info = risk_manager.calculate_position_size(
         portfolio_value, entry_price, stop_loss_price, confidence, "kelly"
     )
-    print("Position sizing:", json.dumps(position_info, indent=2))
+    print("Position sizing:", dumps_pretty(position_info))
     
     # Test stop loss/take profit calculation
     levels = risk_manager.calculate_stop_loss_take_profit(entry_price, 'buy')
-    print("Stop/Profit levels:", json.dumps(levels, indent=2))
+    print("Stop/Profit levels:", dumps_pretty(levels))
     
     # Test portfolio risk assessment
     mock_positions = {
@@ -329,4 +457,4 @@ if __name__ == "__main__":
         'ADA': {'percentage': 10}
     }
     risk_assessment = risk_manager.assess_portfolio_risk(mock_positions)
-    print("Risk assessment:", json.dumps(risk_assessment, indent=2))
\ No newline at end of file
+    print("Risk assessment:", dumps_pretty(risk_assessment))
\ No newline at end of file
@@ -3,21 +3,32 @@ Main trading system orchestrator.
 """
 import asyncio
 import time
-import json
 from typing import Dict, List, Any, Optional
+import numpy as np
 from loguru import logger
 
-from src.data_sources import PriceFetcher, SentimentAnalyzer
-from src.portfolio import CoinbasePortfolioManager
 from src.risk import RiskManager
-from src.llm import LLMTradingAdvisor
 from src.utils import config
+from common.fastjson import dumps_pretty
+
+# Placeholder market context shared by every LLM request; treat as read-only
+_MARKET_CONTEXT = {
+    'trend': 'unknown',
+    'volatility': 'high',  # Crypto is typically high volatility
+    'volume': 'unknown'
+}
 
 
 class TradingSystem:
     """Main trading system orchestrator that coordinates all components."""
     
     def __init__(self):
+        # Network-facing components are imported here so that importing this
+        # module (e.g. for type hints) doesn't load aiohttp, requests and friends
+        from src.data_sources import PriceFetcher, SentimentAnalyzer
+        from src.portfolio import CoinbasePortfolioManager
+        from src.llm import LLMTradingAdvisor
+        
         # Initialize components
         self.price_fetcher = PriceFetcher()
         self.sentiment_analyzer = SentimentAnalyzer(
@@ -49,6 +60,10 @@ class TradingSystem:
         trading_config = config.get_trading_config()
         self.supported_coins = trading_config['supported_coins']
         self.min_trade_amount = trading_config['min_trade_amount']
+        # Resolved once rather than per symbol per cycle
+        self.max_risk_percentage = config.get('trading.risk_per_trade', 0.02) * 100
+        self.sizing_method = config.get('risk_management.position_sizing_method', 'kelly')
+        self.min_confidence = 60  # Minimum 60% LLM confidence
         
         # System state
         self.running = False
@@ -68,6 +83,8 @@ class TradingSystem:
         if not symbols:
             symbols = self.supported_coins
         
+        # One wall-clock timestamp stamps every result of this cycle
+        cycle_time = time.time()
         logger.info(f"Starting analysis cycle for symbols: {symbols}")
         
         try:
@@ -80,28 +97,51 @@ class TradingSystem:
                 logger.error("No verified prices available")
                 return {'error': 'No price data available'}
             
-            # Step 2: Get sentiment data
-            logger.info("Analyzing sentiment...")
-            sentiment_data = await self.sentiment_analyzer.get_sentiment_data(symbols)
-            
-            # Step 3: Get portfolio information
-            logger.info("Retrieving portfolio data...")
-            portfolio_balance = self.portfolio_manager.get_portfolio_balance()
+            # Steps 2 and 3: Get sentiment data and portfolio information concurrently.
+            # The Coinbase client is blocking, so it runs in a worker thread; it also
+            # warms the portfolio cache that the per-symbol position lookups read.
+            logger.info("Analyzing sentiment and retrieving portfolio data...")
+            sentiment_data, portfolio_balance = await asyncio.gather(
+                self.sentiment_analyzer.get_sentiment_data(symbols),
+                asyncio.to_thread(self.portfolio_manager.get_portfolio_balance)
+            )
             portfolio_value = self.portfolio_manager.calculate_portfolio_value(verified_prices)
             
-            # Step 4: Generate trading recommendations
-            recommendations = {}
+            # Step 4: Generate trading recommendations (LLM calls run concurrently)
+            priced_symbols = []
             
             for symbol in symbols:
                 if symbol not in verified_prices:
                     logger.warning(f"Skipping {symbol} - no price data")
                     continue
                 
-                logger.info(f"Generating recommendation for {symbol}")
-                recommendation = await self._generate_recommendation(
-                    symbol, verified_prices, sentiment_data, portfolio_balance, portfolio_value
+                logger.info("Generating recommendation for {}", symbol)
+                priced_symbols.append(symbol)
+            
+            # Size every position in one vectorized pass; for demo, use 5% stop loss
+            entry_prices = np.fromiter((verified_prices[s] for s in priced_symbols),
+                                       dtype=np.float64, count=len(priced_symbols))
+            confidences = np.fromiter((sentiment_data.get(s, {}).get('confidence', 0.5) for s in priced_symbols),
+                                      dtype=np.float64, count=len(priced_symbols))
+            sizing = self.risk_manager.calculate_position_sizes_batch(
+                portfolio_value['total_value_usd'],
+                entry_prices,
+                entry_prices * 0.95,
+                confidences,
+                method=self.sizing_method
+            )
+            levels = self.risk_manager.calculate_stop_loss_take_profit_batch(entry_prices, 1)
+            
+            generated = await asyncio.gather(*(
+                self._generate_recommendation(
+                    symbol, verified_prices, sentiment_data, portfolio_balance, portfolio_value,
+                    {key: values[i].item() for key, values in sizing.items()},
+                    {key: values[i].item() for key, values in levels.items()},
+                    cycle_time
                 )
-                recommendations[symbol] = recommendation
+                for i, symbol in enumerate(priced_symbols)
+            ))
+            recommendations = dict(zip(priced_symbols, generated))
             
             # Step 5: Portfolio risk assessment
             risk_assessment = self.risk_manager.assess_portfolio_risk(
@@ -110,7 +150,7 @@ class TradingSystem:
             
             # Compile results
             analysis_results = {
-                'timestamp': time.time(),
+                'timestamp': cycle_time,
                 'prices': verified_prices,
                 'sentiment': sentiment_data,
                 'portfolio': portfolio_value,
@@ -125,7 +165,7 @@ class TradingSystem:
         except Exception as e:
             logger.error(f"Error in analysis cycle: {e}")
             return {
-                'timestamp': time.time(),
+                'timestamp': cycle_time,
                 'error': str(e),
                 'status': 'error'
             }
@@ -133,31 +173,17 @@ class TradingSystem:
     async def _generate_recommendation(self, symbol: str, prices: Dict[str, float],
                                      sentiment_data: Dict[str, Dict],
                                      portfolio_balance: Dict[str, Dict],
-                                     portfolio_value: Dict[str, Any]) -> Dict[str, Any]:
-        """Generate trading recommendation for a specific symbol."""
+                                     portfolio_value: Dict[str, Any],
+                                     risk_metrics: Dict[str, Any],
+                                     levels: Dict[str, float],
+                                     timestamp: float) -> Dict[str, Any]:
+        """Generate trading recommendation for a specific symbol from its sizing and levels."""
         try:
             current_price = prices[symbol]
             
             # Get current position
             position_info = self.portfolio_manager.get_position_value(symbol, prices)
             
-            # Calculate risk metrics
-            # For demo, use 5% stop loss
-            stop_loss_price = current_price * 0.95
-            
-            risk_metrics = self.risk_manager.calculate_position_size(
-                portfolio_value['total_value_usd'],
-                current_price,
-                stop_loss_price,
-                confidence=sentiment_data.get(symbol, {}).get('confidence', 0.5),
-                method=config.get('risk_management.position_sizing_method', 'kelly')
-            )
-            
-            # Calculate stop loss and take profit levels
-            levels = self.risk_manager.calculate_stop_loss_take_profit(
-                current_price, 'buy'
-            )
-            
             # Build context for LLM
             context = {
                 'symbol': symbol,
@@ -174,15 +200,11 @@ class TradingSystem:
                     'take_profit_price': levels['take_profit']
                 },
                 'position_info': position_info,
-                'market_context': {
-                    'trend': 'unknown',
-                    'volatility': 'high',  # Crypto is typically high volatility
-                    'volume': 'unknown'
-                }
+                'market_context': _MARKET_CONTEXT
             }
             
             # Get LLM recommendation
-            llm_recommendation = self.llm_advisor.get_trading_recommendation(context)
+            llm_recommendation = await self.llm_advisor.get_trading_recommendation_async(context)
             
             # Combine all data
             recommendation = {
@@ -194,7 +216,7 @@ class TradingSystem:
                 'sentiment': sentiment_data.get(symbol, {}),
                 'llm_recommendation': llm_recommendation,
                 'actionable': self._is_actionable(llm_recommendation, risk_metrics),
-                'timestamp': time.time()
+                'timestamp': timestamp
             }
             
             return recommendation
@@ -204,27 +226,22 @@ class TradingSystem:
             return {
                 'symbol': symbol,
                 'error': str(e),
-                'timestamp': time.time()
+                'timestamp': timestamp
             }
     
     def _is_actionable(self, llm_recommendation: Dict, risk_metrics: Dict) -> bool:
         """Determine if a recommendation is actionable based on risk criteria."""
-        # Check minimum trade amount
-        position_value = risk_metrics.get('position_value_usd', 0)
-        if position_value < self.min_trade_amount:
-            return False
-        
-        # Check confidence threshold
+        # Check confidence threshold first: it rejects most recommendations
         confidence = llm_recommendation.get('confidence', 0)
-        if confidence < 60:  # Minimum 60% confidence
+        if confidence < self.min_confidence:
             return False
         
-        # Check risk percentage
-        risk_percentage = risk_metrics.get('max_loss_percentage', 0)
-        if risk_percentage > config.get('trading.risk_per_trade', 0.02) * 100:
+        # Check risk percentage (risk_metrics always carries the sizing fields)
+        if risk_metrics['max_loss_percentage'] > self.max_risk_percentage:
             return False
         
-        return True
+        # Check minimum trade amount
+        return risk_metrics['position_value_usd'] >= self.min_trade_amount
     
     async def execute_recommendation(self, recommendation: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -350,7 +367,7 @@ class TradingSystem:
                             confidence = llm_rec.get('confidence', 0)
                             actionable = rec.get('actionable', False)
                             
-                            logger.info(f"{symbol}: {action} (confidence: {confidence}%, actionable: {actionable})")
+                            logger.info("{}: {} (confidence: {}%, actionable: {})", symbol, action, confidence, actionable)
                     
                     # Execute trades if enabled
                     if execute_trades:
@@ -372,14 +389,25 @@ class TradingSystem:
                 await asyncio.sleep(60)  # Wait 1 minute on error
         
         self.running = False
+        await self.close()
         logger.info("Trading system stopped")
     
     def stop(self):
         """Stop the trading system."""
         self.running = False
+    
+    async def close(self):
+        """Release pooled network resources held by the components."""
+        await self.price_fetcher.close()
+        await self.sentiment_analyzer.close()
+        await self.llm_advisor.close()
+        await self.portfolio_manager.close()
 
 
 if __name__ == "__main__":
+    from src.utils import LoggerConfig
+    LoggerConfig.setup_default_logging()
+    
     # Initialize and test the trading system
     trading_system = TradingSystem()
     
@@ -389,6 +417,8 @@ if __name__ == "__main__":
         results = await trading_system.run_analysis_cycle(['BTC', 'ETH'])
         
         print("\n=== Analysis Results ===")
-        print(json.dumps(results, indent=2, default=str))
+        print(dumps_pretty(results, default=str))
+        
+        await trading_system.close()
     
     asyncio.run(main())
\ No newline at end of file
@@ -1,11 +1,27 @@
 """
 Configuration management for the LLM Logic Trading System.
 """
-import json
 import os
 from pathlib import Path
 from typing import Dict, Any, Optional
 
+from common.fastjson import loads
+
+# Repository root (src/utils/config.py -> ../../..), resolved once at import
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+
+
+def _flatten(data: Dict[str, Any], prefix: str = '', out: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Map every dotted key path in data (sections included) to its value."""
+    if out is None:
+        out = {}
+    for key, value in data.items():
+        path = f"{prefix}{key}"
+        out[path] = value
+        if isinstance(value, dict):
+            _flatten(value, f"{path}.", out)
+    return out
+
 
 class ConfigManager:
     """Manages configuration for the trading system."""
@@ -16,23 +32,36 @@ class ConfigManager:
             self.config_path = Path(config_path)
         else:
             # Default to config/trading_config.json relative to project root
-            self.config_path = Path(__file__).parent.parent.parent / "config" / "trading_config.json"
+            self.config_path = PROJECT_ROOT / "config" / "trading_config.json"
         
+        # Loaded on first read, so importing this module costs no file I/O
+        self._config_data = None
+        self._flat: Dict[str, Any] = {}  # dotted key -> value, built at load
+        self._derived: Dict[str, Dict[str, Any]] = {}  # section -> dict with env overrides applied
+    
+    def reload(self):
+        """Re-read the configuration file and environment overrides on next access."""
         self._config_data = None
-        self._load_config()
+        self._flat = {}
+        self._derived.clear()
+    
+    def _ensure_config(self) -> Dict[str, Any]:
+        """Return the configuration, loading it on first use."""
+        if self._config_data is None:
+            self._load_config()
+        return self._config_data
     
     def _load_config(self):
         """Load configuration from JSON file."""
         try:
-            if self.config_path.exists():
-                with open(self.config_path, 'r') as f:
-                    self._config_data = json.load(f)
-            else:
-                # Fallback to default configuration
-                self._config_data = self._get_default_config()
+            self._config_data = loads(self.config_path.read_bytes())
+        except FileNotFoundError:
+            # Fallback to default configuration
+            self._config_data = self._get_default_config()
         except Exception as e:
             print(f"Warning: Could not load config from {self.config_path}: {e}")
             self._config_data = self._get_default_config()
+        self._flat = _flatten(self._config_data) if isinstance(self._config_data, dict) else {}
     
     def _get_default_config(self) -> Dict[str, Any]:
         """Get default configuration."""
@@ -63,58 +92,57 @@ class ConfigManager:
     
     def get(self, key: str, default: Any = None) -> Any:
         """Get configuration value using dot notation."""
-        if not self._config_data:
-            return default
-        
-        keys = key.split('.')
-        value = self._config_data
-        
-        for k in keys:
-            if isinstance(value, dict) and k in value:
-                value = value[k]
-            else:
-                return default
-        
-        return value
+        if self._config_data is None:
+            self._load_config()
+        return self._flat.get(key, default)
     
     def get_trading_config(self) -> Dict[str, Any]:
         """Get trading configuration."""
-        return self._config_data.get('trading', {})
+        return self._ensure_config().get('trading', {})
     
     def get_risk_config(self) -> Dict[str, Any]:
         """Get risk management configuration."""
-        return self._config_data.get('risk_management', {})
+        return self._ensure_config().get('risk_management', {})
     
     def get_llm_config(self) -> Dict[str, Any]:
-        """Get LLM configuration."""
-        base_config = self._config_data.get('llm', {})
-        return {
-            'api_key': os.getenv('OPENAI_API_KEY') or os.getenv('LM_STUDIO_API_KEY'),
-            'model': os.getenv('LLM_MODEL', base_config.get('model', 'gpt-4')),
-            'max_tokens': int(os.getenv('LLM_MAX_TOKENS', base_config.get('max_tokens', 1000))),
-            'temperature': float(os.getenv('LLM_TEMPERATURE', base_config.get('temperature', 0.7)))
-        }
+        """Get LLM configuration (resolved once; call reload() to re-read)."""
+        llm_config = self._derived.get('llm')
+        if llm_config is None:
+            base_config = self._ensure_config().get('llm', {})
+            llm_config = self._derived['llm'] = {
+                'api_key': os.getenv('OPENAI_API_KEY') or os.getenv('LM_STUDIO_API_KEY'),
+                'model': os.getenv('LLM_MODEL', base_config.get('model', 'gpt-4')),
+                'max_tokens': int(os.getenv('LLM_MAX_TOKENS', base_config.get('max_tokens', 1000))),
+                'temperature': float(os.getenv('LLM_TEMPERATURE', base_config.get('temperature', 0.7)))
+            }
+        return llm_config
     
     def get_coinbase_config(self) -> Dict[str, Any]:
-        """Get Coinbase configuration from environment variables."""
-        return {
-            'api_key': os.getenv('COINBASE_API_KEY'),
-            'api_secret': os.getenv('COINBASE_API_SECRET'),
-            'passphrase': os.getenv('COINBASE_PASSPHRASE'),
-            'sandbox': os.getenv('COINBASE_USE_SANDBOX', 'true').lower() in ('true', '1', 'yes'),
-            'api_target': os.getenv('COINBASE_API_TARGET', 'exchange')
-        }
+        """Get Coinbase configuration from environment variables (resolved once; call reload() to re-read)."""
+        coinbase_config = self._derived.get('coinbase')
+        if coinbase_config is None:
+            coinbase_config = self._derived['coinbase'] = {
+                'api_key': os.getenv('COINBASE_API_KEY'),
+                'api_secret': os.getenv('COINBASE_API_SECRET'),
+                'passphrase': os.getenv('COINBASE_PASSPHRASE'),
+                'sandbox': os.getenv('COINBASE_USE_SANDBOX', 'true').lower() in ('true', '1', 'yes'),
+                'api_target': os.getenv('COINBASE_API_TARGET', 'exchange')
+            }
+        return coinbase_config
     
     def get_data_sources_config(self) -> Dict[str, Any]:
-        """Get data sources configuration."""
-        base_config = self._config_data.get('data_sources', {})
-        return {
-            **base_config,
-            'news_api_key': os.getenv('NEWS_API_KEY'),
-            'lunarcrush_api_key': os.getenv('LUNARCRUSH_API_KEY'),
-            'coinmarketcap_api_key': os.getenv('COINMARKETCAP_API_KEY'),
-            'whalealert_api_key': os.getenv('WHALEALERT_API_KEY')
-        }
+        """Get data sources configuration (resolved once; call reload() to re-read)."""
+        data_sources_config = self._derived.get('data_sources')
+        if data_sources_config is None:
+            base_config = self._ensure_config().get('data_sources', {})
+            data_sources_config = self._derived['data_sources'] = {
+                **base_config,
+                'news_api_key': os.getenv('NEWS_API_KEY'),
+                'lunarcrush_api_key': os.getenv('LUNARCRUSH_API_KEY'),
+                'coinmarketcap_api_key': os.getenv('COINMARKETCAP_API_KEY'),
+                'whalealert_api_key': os.getenv('WHALEALERT_API_KEY')
+            }
+        return data_sources_config
 
 
 # Global configuration instance
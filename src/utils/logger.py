@@ -7,9 +7,18 @@ from pathlib import Path
 from loguru import logger
 from typing import Optional
 
+from src.utils.config import PROJECT_ROOT
+
 
 class LoggerConfig:
-    """Configures application logging with loguru."""
+    """
+    Configures application logging with loguru.
+    
+    Sinks filter on the level loguru resolves once at add() time. Per-symbol
+    and other hot-path calls should pass arguments ("... {}", value) rather
+    than f-strings so suppressed records are never formatted, and use
+    logger.opt(lazy=True) when an argument is itself expensive to compute.
+    """
     
     def __init__(self, log_level: str = "INFO", log_file: Optional[str] = None):
         self.log_level = log_level.upper()
@@ -21,12 +30,12 @@ class LoggerConfig:
         # Remove default handler
         logger.remove()
         
-        # Console handler with colored output
+        # Console handler, colored only when stderr is a terminal
         logger.add(
             sys.stderr,
             format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
             level=self.log_level,
-            colorize=True
+            colorize=sys.stderr.isatty()
         )
         
         # File handler if specified
@@ -47,13 +56,9 @@ class LoggerConfig:
     def setup_default_logging():
         """Setup default logging configuration."""
         log_level = os.getenv('LOG_LEVEL', 'INFO')
-        log_dir = Path(__file__).parent.parent.parent / "logs"
+        log_dir = PROJECT_ROOT / "logs"
         log_file = log_dir / "trading_system.log"
         
         LoggerConfig(log_level=log_level, log_file=str(log_file))
         
         logger.info("Logging system initialized")
-
-
-# Initialize default logging when module is imported
-LoggerConfig.setup_default_logging()
\ No newline at end of file
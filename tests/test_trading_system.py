@@ -1,29 +1,34 @@
 """
 Basic tests for the trading system components.
 """
-import unittest
 import asyncio
+import json
+import unittest
 import sys
 from pathlib import Path
+from unittest import mock
 
-# Add src to path
-sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+# Add the project root to path (tests import both src.* and the top-level llm package)
+sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from src.data_sources import PriceFetcher, SentimentAnalyzer
 from src.portfolio import CoinbasePortfolioManager
 from src.risk import RiskManager
+from src.llm import LLMTradingAdvisor
+from src.llm.trading_advisor import _JsonBlockScanner
 from src.utils import config
+from llm import decision_engine
 
 
 class TestPriceFetcher(unittest.TestCase):
     """Test price fetching functionality."""
     
     def setUp(self):
+        # Per test: the client's session and async primitives bind to an event loop
         self.price_fetcher = PriceFetcher()
     
     def test_initialization(self):
         """Test that price fetcher initializes correctly."""
-        self.assertIsNotNone(self.price_fetcher)
         self.assertIn('coingecko', self.price_fetcher.sources)
         self.assertIn('coinbase', self.price_fetcher.sources)
     
@@ -47,10 +52,6 @@ class TestSentimentAnalyzer(unittest.TestCase):
     def setUp(self):
         self.sentiment_analyzer = SentimentAnalyzer()
     
-    def test_initialization(self):
-        """Test sentiment analyzer initialization."""
-        self.assertIsNotNone(self.sentiment_analyzer)
-    
     def test_sentiment_interpretation(self):
         """Test sentiment score interpretation."""
         self.assertEqual(self.sentiment_analyzer._interpret_sentiment(0.4), "Very Bullish")
@@ -63,12 +64,12 @@ class TestSentimentAnalyzer(unittest.TestCase):
 class TestPortfolioManager(unittest.TestCase):
     """Test portfolio management functionality."""
     
-    def setUp(self):
-        self.portfolio_manager = CoinbasePortfolioManager(sandbox=True)
+    @classmethod
+    def setUpClass(cls):
+        cls.portfolio_manager = CoinbasePortfolioManager(sandbox=True)
     
     def test_initialization(self):
         """Test portfolio manager initialization."""
-        self.assertIsNotNone(self.portfolio_manager)
         self.assertTrue(self.portfolio_manager.sandbox)
     
     def test_mock_portfolio(self):
@@ -94,12 +95,12 @@ class TestPortfolioManager(unittest.TestCase):
 class TestRiskManager(unittest.TestCase):
     """Test risk management functionality."""
     
-    def setUp(self):
-        self.risk_manager = RiskManager()
+    @classmethod
+    def setUpClass(cls):
+        cls.risk_manager = RiskManager()
     
     def test_initialization(self):
         """Test risk manager initialization."""
-        self.assertIsNotNone(self.risk_manager)
         self.assertEqual(self.risk_manager.max_position_size, 0.1)
         self.assertEqual(self.risk_manager.risk_per_trade, 0.02)
     
@@ -127,6 +128,35 @@ class TestRiskManager(unittest.TestCase):
         self.assertIn('take_profit', levels)
         self.assertLess(levels['stop_loss'], entry_price)
         self.assertGreater(levels['take_profit'], entry_price)
+    
+    def test_batch_position_sizing_matches_scalar(self):
+        """Test batch position sizing agrees with calculate_position_size for every method."""
+        entry_prices = [45000, 3000, 0.5]
+        stop_loss_prices = [43000, 2850, 0.45]
+        confidences = [0.8, 0.55, 0.3]
+        
+        for method in ('fixed_risk', 'kelly', 'volatility'):
+            with self.subTest(method=method):
+                batch = self.risk_manager.calculate_position_sizes_batch(
+                    10000, entry_prices, stop_loss_prices, confidences, method
+                )
+                for i, args in enumerate(zip(entry_prices, stop_loss_prices, confidences)):
+                    scalar = self.risk_manager.calculate_position_size(10000, *args, method=method)
+                    for key, value in scalar.items():
+                        if key == 'method_used':
+                            self.assertEqual(batch[key][i], value)
+                        else:
+                            self.assertAlmostEqual(float(batch[key][i]), value, places=6, msg=key)
+    
+    def test_batch_position_sizing_empty_portfolio(self):
+        """Test an empty portfolio yields zeroed rows instead of NaN percentages."""
+        batch = self.risk_manager.calculate_position_sizes_batch(
+            0, [45000, 3000], [43000, 2850], [0.8, 0.8], 'kelly'
+        )
+        
+        self.assertEqual(list(batch['method_used']), ['none', 'none'])
+        self.assertEqual(list(batch['portfolio_percentage']), [0.0, 0.0])
+        self.assertEqual(list(batch['max_loss_percentage']), [0.0, 0.0])
 
 
 class TestConfiguration(unittest.TestCase):
@@ -150,39 +180,223 @@ class TestConfiguration(unittest.TestCase):
         self.assertEqual(unknown_value, 'default')
 
 
-class TestAsyncComponents(unittest.TestCase):
+class TestLLMResponseParsing(unittest.TestCase):
+    """Test turning LLM replies into recommendations."""
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.advisor = LLMTradingAdvisor(endpoint_url='http://localhost/v1/completions')
+    
+    def _parse(self, response):
+        return self.advisor._parse_llm_response(response, {'symbol': 'BTC'})
+    
+    def test_decision_endpoint_reply(self):
+        """Test the decision for the requested symbol is picked from the list."""
+        recommendation = self._parse({'decisions': [
+            {'symbol': 'ETH', 'action': 'SELL', 'confidence': 90, 'reason': 'eth'},
+            {'symbol': 'btc', 'action': 'buy', 'confidence': 72, 'reason': 'btc'}
+        ]})
+        
+        self.assertEqual(recommendation, {'symbol': 'BTC', 'action': 'BUY', 'confidence': 72.0, 'reason': 'btc'})
+    
+    def test_completions_reply_with_json(self):
+        """Test a JSON object inside completions text or chat content is read field by field."""
+        text = 'Analysis done.\n{"action": "SELL", "confidence": 80, "reason": "Breaking \\"support\\""}'
+        for response in ({'choices': [{'text': text}]},
+                         {'choices': [{'message': {'content': text}}]}):
+            with self.subTest(response=response):
+                recommendation = self._parse(response)
+                self.assertEqual(recommendation['action'], 'SELL')
+                self.assertEqual(recommendation['confidence'], 80.0)
+                self.assertEqual(recommendation['reason'], 'Breaking "support"')
+    
+    def test_free_text_with_buy_and_sell_holds(self):
+        """Test free text mentioning both buy and sell gives HOLD."""
+        recommendation = self._parse({'choices': [{'text': 'Buy the dip or sell the rally? Confidence: 55'}]})
+        
+        self.assertEqual(recommendation['action'], 'HOLD')
+        self.assertEqual(recommendation['confidence'], 55.0)
+    
+    def test_confidence_out_of_range_and_bare_percentage(self):
+        """Test confidences above 100 are skipped in text, clamped in JSON, and bare N% is read."""
+        text = self._parse({'choices': [{'text': 'Sell. Confidence: 150 points, call it 70%'}]})
+        self.assertEqual((text['action'], text['confidence']), ('SELL', 70.0))
+        
+        bare = self._parse('I would buy here, about 85% sure.')
+        self.assertEqual((bare['action'], bare['confidence']), ('BUY', 85.0))
+        
+        clamped = self._parse({'choices': [{'text': '{"action": "BUY", "confidence": 250, "reason": "x"}'}]})
+        self.assertEqual(clamped['confidence'], 100.0)
+    
+    def test_malformed_json_falls_back_to_text(self):
+        """Test an unterminated JSON object falls back to the free-text scan."""
+        recommendation = self._parse({'choices': [{'text': 'Verdict: {"action": "SELL", "confidence": 7'}]})
+        
+        self.assertEqual(recommendation['action'], 'SELL')
+        self.assertEqual(recommendation['confidence'], 7.0)
+    
+    def test_json_block_scanner(self):
+        """Test the streaming scanner returns the first complete block, ignoring braces in strings."""
+        scanner = _JsonBlockScanner()
+        
+        self.assertIsNone(scanner.feed('noise {"a": "}{"'))
+        self.assertEqual(scanner.feed(', "b": [1, 2]} trailing {'), '{"a": "}{", "b": [1, 2]}')
+
+
+class TestRecommendationCache(unittest.TestCase):
+    """Test reuse of recommendations for near-identical contexts."""
+    
+    def setUp(self):
+        self.advisor = LLMTradingAdvisor(endpoint_url='http://localhost/v1/completions')
+        self.advisor.cache_ttl = 60
+        self.queries = 0
+    
+    def _fake_query_llm(self, context, model=None):
+        self.queries += 1
+        return {'choices': [{'text': '{"action": "BUY", "confidence": 70, "reason": "x"}'}]}
+    
+    def _recommend(self, price, timestamp):
+        context = {'symbol': 'BTC', 'prices': {'current_price': price}, 'timestamp': timestamp}
+        with mock.patch.object(self.advisor, '_query_llm', self._fake_query_llm):
+            return self.advisor.get_trading_recommendation(context)
+    
+    def test_timestamp_only_change_hits_cache(self):
+        """Test contexts differing only by timestamp share one LLM query."""
+        self._recommend(65432.0, 1000.0)
+        self._recommend(65432.0, 1030.0)
+        
+        self.assertEqual(self.queries, 1)
+    
+    def test_material_price_move_misses_cache(self):
+        """Test a ~0.1% price move is not answered from the cache."""
+        self._recommend(65432.0, 1000.0)
+        self._recommend(65380.0, 1000.0)
+        
+        self.assertEqual(self.queries, 2)
+
+
+class TestModelRace(unittest.IsolatedAsyncioTestCase):
+    """Test racing the fast model against the main model."""
+    
+    def setUp(self):
+        self.advisor = LLMTradingAdvisor(endpoint_url='http://localhost/v1/completions')
+        self.advisor.model = 'main'
+        self.advisor.fast_model = 'fast'
+        self.replies = {'main': '{"action": "SELL", "confidence": 90, "reason": "main"}'}
+    
+    async def _fake_aquery_llm(self, context, model=None):
+        if model == 'main':
+            await asyncio.sleep(0.01)
+        return {'choices': [{'text': self.replies[model]}]}
+    
+    async def _recommend(self):
+        with mock.patch.object(self.advisor, '_aquery_llm', self._fake_aquery_llm):
+            return await self.advisor.get_trading_recommendation_async({'symbol': 'BTC'})
+    
+    async def test_valid_fast_reply_wins_uncached(self):
+        """Test a well-formed fast reply is returned but not cached as the main model's."""
+        self.replies['fast'] = '{"action": "BUY", "confidence": 60, "reason": "fast"}'
+        recommendation = await self._recommend()
+        
+        self.assertEqual(recommendation['reason'], 'fast')
+        self.assertEqual(len(self.advisor._cache), 0)
+    
+    async def test_unusable_fast_reply_waits_for_main(self):
+        """Test a free-text fast reply doesn't win the race."""
+        self.replies['fast'] = 'maybe buy, maybe sell'
+        recommendation = await self._recommend()
+        
+        self.assertEqual(recommendation['action'], 'SELL')
+        self.assertEqual(recommendation['reason'], 'main')
+        self.assertEqual(len(self.advisor._cache), 1)
+
+
+class TestBatchedRecommendations(unittest.IsolatedAsyncioTestCase):
+    """Test several symbols per LLM request."""
+    
+    async def test_malformed_item_falls_back_per_symbol(self):
+        """Test a batch item with a non-numeric confidence retries each symbol on its own."""
+        advisor = LLMTradingAdvisor(endpoint_url='http://localhost/v1/completions')
+        advisor.cache_ttl = 0
+        batch_text = ('[{"action": "BUY", "confidence": "high", "reason": "a"},'
+                      ' {"action": "SELL", "confidence": 70, "reason": "b"}]')
+        
+        async def fake_apost(*args, **kwargs):
+            return {'choices': [{'text': batch_text}]}
+        
+        async def fake_aquery_llm(context, model=None):
+            return {'choices': [{'text': '{"action": "HOLD", "confidence": 40, "reason": "single"}'}]}
+        
+        with mock.patch.object(advisor, '_apost', fake_apost), \
+                mock.patch.object(advisor, '_aquery_llm', fake_aquery_llm):
+            recommendations = await advisor.get_trading_recommendations_batch(
+                [{'symbol': 'BTC'}, {'symbol': 'ETH'}]
+            )
+        
+        self.assertEqual([r['symbol'] for r in recommendations], ['BTC', 'ETH'])
+        self.assertEqual([r['reason'] for r in recommendations], ['single', 'single'])
+
+
+class TestAsyncComponents(unittest.IsolatedAsyncioTestCase):
     """Test async components."""
     
-    def test_price_fetching_async(self):
+    async def test_price_fetching_async(self):
         """Test async price fetching."""
-        async def test_fetch():
-            price_fetcher = PriceFetcher()
-            prices = await price_fetcher.get_prices(['BTC'])
-            return prices
-        
-        # Run the async test
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        price_fetcher = PriceFetcher()
         try:
-            result = loop.run_until_complete(test_fetch())
-            self.assertIsInstance(result, dict)
+            result = await price_fetcher.get_prices(['BTC'])
         finally:
-            loop.close()
+            await price_fetcher.close()
+        self.assertIsInstance(result, dict)
     
-    def test_sentiment_analysis_async(self):
+    async def test_sentiment_analysis_async(self):
         """Test async sentiment analysis."""
-        async def test_sentiment():
-            sentiment_analyzer = SentimentAnalyzer()
-            sentiment = await sentiment_analyzer.get_sentiment_data(['BTC'])
-            return sentiment
-        
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        sentiment_analyzer = SentimentAnalyzer()
         try:
-            result = loop.run_until_complete(test_sentiment())
-            self.assertIsInstance(result, dict)
+            result = await sentiment_analyzer.get_sentiment_data(['BTC'])
         finally:
-            loop.close()
+            await sentiment_analyzer.close()
+        self.assertIsInstance(result, dict)
+
+
+class TestBatchingLLMClient(unittest.IsolatedAsyncioTestCase):
+    """Test request coalescing in the decision engine."""
+    
+    async def _fake_query_llm(self, context_json, system_prompt=None, session=None):
+        self.calls.append(json.loads(context_json))
+        decisions = [{'symbol': sym, 'action': 'BUY', 'confidence': 0.8, 'reason': ''}
+                     for sym in json.loads(context_json)]
+        return {'decisions': decisions, 'raw': '', 'used_endpoint': True, 'error': None}
+    
+    async def asyncSetUp(self):
+        self.calls = []
+        patcher = mock.patch.object(decision_engine, 'query_llm', self._fake_query_llm)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    async def test_concurrent_submits_share_one_request(self):
+        """Test two callers are merged into one query and each gets its own decisions."""
+        client = decision_engine.BatchingLLMClient(batch_interval_ms=5)
+        btc, eth = await asyncio.gather(
+            client.submit(json.dumps({'BTC': {'price': 45000}})),
+            client.submit(json.dumps({'ETH': {'price': 3000}}))
+        )
+        
+        self.assertEqual(self.calls, [{'BTC': {'price': 45000}, 'ETH': {'price': 3000}}])
+        self.assertEqual([d['symbol'] for d in btc['decisions']], ['BTC'])
+        self.assertEqual([d['symbol'] for d in eth['decisions']], ['ETH'])
+    
+    async def test_repeated_symbol_is_not_merged(self):
+        """Test a symbol submitted twice keeps each caller's context."""
+        client = decision_engine.BatchingLLMClient(batch_interval_ms=5)
+        first, second = await asyncio.gather(
+            client.submit(json.dumps({'BTC': {'price': 45000}})),
+            client.submit(json.dumps({'BTC': {'price': 45100}}))
+        )
+        
+        self.assertEqual(self.calls, [{'BTC': {'price': 45000}}, {'BTC': {'price': 45100}}])
+        self.assertEqual([d['symbol'] for d in first['decisions']], ['BTC'])
+        self.assertEqual([d['symbol'] for d in second['decisions']], ['BTC'])
 
 
 if __name__ == '__main__':
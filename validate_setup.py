@@ -3,11 +3,65 @@
 Basic validation script for LLM Logic Trading System
 Tests core functionality that doesn't require external dependencies or network access.
 """
-import json
 import os
+import re
+import subprocess
 import sys
 from pathlib import Path
 
+from common.fastjson import loads
+
+# Directories never searched for required project files
+_SKIP_DIRS = {'.git', 'node_modules', '__pycache__', '.venv', 'venv', 'logs'}
+
+def _git_paths(root='.'):
+    """
+    Tracked and untracked-but-not-ignored paths that exist in the working tree,
+    from one git call, or None outside a checkout.
+    """
+    try:
+        # -t tags each line; a tracked file deleted from disk is listed as both H and R
+        listing = subprocess.check_output(
+            ['git', 'ls-files', '--cached', '--others', '--deleted', '--exclude-standard', '-t'],
+            cwd=root, text=True, stderr=subprocess.DEVNULL
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    files = set()
+    deleted = set()
+    for line in listing.splitlines():
+        tag, path = line[0], line[2:]
+        (deleted if tag == 'R' else files).add(path)
+    present = set()
+    for path in files - deleted:
+        present.add(path)
+        # Every ancestor directory of a listed file exists too
+        end = path.find('/')
+        while end != -1:
+            present.add(path[:end + 1])
+            end = path.find('/', end + 1)
+    return present
+
+def _project_paths(root='.'):
+    """Relative paths under root (directories get a trailing '/'): git's file list, else one walk."""
+    present = _git_paths(root)
+    if present is not None:
+        return present
+    present = set()
+    for dirpath, dirs, files in os.walk(root, topdown=True):
+        dirs[:] = [d for d in dirs if d not in _SKIP_DIRS]
+        rel = os.path.relpath(dirpath, root)
+        prefix = '' if rel == '.' else rel.replace(os.sep, '/') + '/'
+        present.update(prefix + d + '/' for d in dirs)
+        present.update(prefix + f for f in files)
+    return present
+
+def _missing(content, needles):
+    """Needles that don't occur in content, found with one regex pass instead of one scan each."""
+    alternatives = '|'.join(map(re.escape, sorted(needles, key=len, reverse=True)))
+    found = set(re.findall(f'(?=({alternatives}))', content))
+    return [needle for needle in needles if needle not in found]
+
 def test_project_structure():
     """Test that all required files and directories exist."""
     print("🔍 Testing project structure...")
@@ -37,13 +91,15 @@ def test_project_structure():
         'docs/'
     ]
     
+    present = _project_paths()
+    
     for file_path in required_files:
-        if not Path(file_path).exists():
+        if file_path not in present:
             raise FileNotFoundError(f"Required file missing: {file_path}")
         print(f"  ✓ {file_path}")
     
     for dir_path in required_dirs:
-        if not Path(dir_path).exists():
+        if dir_path not in present:
             raise FileNotFoundError(f"Required directory missing: {dir_path}")
         print(f"  ✓ {dir_path}")
     
@@ -58,19 +114,18 @@ def test_config_files():
         'config/trading_config.example.json'
     ]
     
+    parsed = {}
     for config_file in config_files:
-        with open(config_file, 'r') as f:
-            config = json.load(f)
-            assert isinstance(config, dict), f"{config_file} must be a JSON object"
-            print(f"  ✓ {config_file} is valid JSON")
+        config = parsed[config_file] = loads(Path(config_file).read_bytes())
+        assert isinstance(config, dict), f"{config_file} must be a JSON object"
+        print(f"  ✓ {config_file} is valid JSON")
     
     # Test specific config structure
-    with open('config/trading_config.json', 'r') as f:
-        config = json.load(f)
-        required_sections = ['trading', 'risk_management', 'llm']
-        for section in required_sections:
-            assert section in config, f"Missing required section: {section}"
-            print(f"  ✓ Has {section} section")
+    config = parsed['config/trading_config.json']
+    required_sections = ['trading', 'risk_management', 'llm']
+    for section in required_sections:
+        assert section in config, f"Missing required section: {section}"
+        print(f"  ✓ Has {section} section")
     
     print("✅ Configuration files are valid")
 
@@ -90,8 +145,9 @@ def test_env_example():
         'LOG_LEVEL'
     ]
     
+    missing = _missing(content, required_vars)
+    assert not missing, f"Missing required environment variable(s): {', '.join(missing)}"
     for var in required_vars:
-        assert var in content, f"Missing required environment variable: {var}"
         print(f"  ✓ {var}")
     
     print("✅ .env.example contains required variables")
@@ -103,17 +159,15 @@ def test_documentation():
     # Test README.md
     with open('README.md', 'r') as f:
         readme_content = f.read()
-        assert 'LLM Logic Trading System' in readme_content
-        assert 'Installation' in readme_content
-        assert 'Usage' in readme_content
+        missing = _missing(readme_content, ['LLM Logic Trading System', 'Installation', 'Usage'])
+        assert not missing, f"README.md missing: {', '.join(missing)}"
         print("  ✓ README.md has required sections")
     
     # Test RUNBOOK.md
     with open('docs/RUNBOOK.md', 'r') as f:
         runbook_content = f.read()
-        assert 'Prerequisites' in runbook_content
-        assert 'Operating Modes' in runbook_content
-        assert 'Troubleshooting' in runbook_content
+        missing = _missing(runbook_content, ['Prerequisites', 'Operating Modes', 'Troubleshooting'])
+        assert not missing, f"RUNBOOK.md missing: {', '.join(missing)}"
         print("  ✓ RUNBOOK.md has required sections")
     
     print("✅ Documentation is complete")
@@ -125,10 +179,8 @@ def test_ci_workflow():
     with open('.github/workflows/ci.yml', 'r') as f:
         content = f.read()
         # Basic structure checks
-        assert 'name: CI' in content
-        assert 'on:' in content
-        assert 'jobs:' in content
-        assert 'python-version:' in content
+        missing = _missing(content, ['name: CI', 'on:', 'jobs:', 'python-version:'])
+        assert not missing, f"CI workflow missing: {', '.join(missing)}"
         print("  ✓ CI workflow has basic structure")
     
     print("✅ CI workflow is valid")
@@ -142,8 +194,9 @@ def test_gitignore():
     
     important_ignores = ['.env', '__pycache__', '*.log']
     
+    missing = _missing(content, important_ignores)
+    assert not missing, f"Missing important ignore pattern(s): {', '.join(missing)}"
     for ignore_pattern in important_ignores:
-        assert ignore_pattern in content, f"Missing important ignore pattern: {ignore_pattern}"
         print(f"  ✓ Ignores {ignore_pattern}")
     
     print("✅ .gitignore is properly configured")